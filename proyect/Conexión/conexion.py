@@ -1,76 +1,330 @@
 # Conexión/conexion.py
 import mysql.connector
 from mysql.connector import Error
+from mysql.connector.errors import PoolError
+from contextlib import contextmanager
+from collections import deque, OrderedDict
+from flask import g, has_app_context
 import os
+import threading
+import time
 from dotenv import load_dotenv
 
 # Cargar variables de entorno desde el archivo .env
 load_dotenv()
 
-class MySQLConnection:
-    def __init__(self):
-        self.connection = None
-        # Configuración de la conexión usando variables de entorno
-        self.config = {
-            'host': os.getenv('DB_HOST', 'localhost'),
-            'port': int(os.getenv('DB_PORT', '3307')),  # Tu puerto 330
-            'database': os.getenv('DB_NAME', 'dbcaprichos'),
-            'user': os.getenv('DB_USER', 'root'),
-            'password': '000000',  # <-- entre comillas
-            'autocommit': True,
-            'charset': 'utf8mb4'
+# Configuración de la conexión usando variables de entorno
+DB_CONFIG = {
+    'host': os.getenv('DB_HOST', 'localhost'),
+    'port': int(os.getenv('DB_PORT', '3307')),  # Tu puerto 330
+    'database': os.getenv('DB_NAME', 'dbcaprichos'),
+    'user': os.getenv('DB_USER', 'root'),
+    'password': os.getenv('DB_PASSWORD', '000000'),
+    'autocommit': True,
+    'charset': 'utf8mb4'
+}
+
+class PoolConexiones:
+    """Pool acotado de conexiones MySQL.
+
+    - Nunca hay más de `tamano` conexiones abiertas; si todas están en uso,
+      obtener() espera hasta `espera_max` segundos y luego lanza PoolError.
+    - Antes de entregar una conexión que estuvo inactiva más de `ping_tras`
+      segundos se comprueba que siga viva (pre-ping).
+    - Las conexiones con más de `max_vida` segundos se cierran y se reemplazan.
+    """
+
+    def __init__(self, config, tamano=5, max_vida=1800, espera_max=10, ping_tras=30, conectar=None):
+        self.config = config
+        self.tamano = tamano
+        self.max_vida = max_vida
+        self.espera_max = espera_max
+        self.ping_tras = ping_tras
+        self._conectar = conectar or (lambda: mysql.connector.connect(**self.config))
+        self._libres = deque()     # (conexion, creada, ultimo_uso)
+        self._creada = {}          # id(conexion) -> momento de creación
+        self._preparadas = {}      # id(conexion) -> OrderedDict(query -> (query, cursor))
+        self.max_preparadas = 32
+        self._abiertas = 0
+        self._cond = threading.Condition()
+        self.contadores = {
+            'entregas': 0,
+            'en_uso': 0,
+            'esperas': 0,
+            'espera_total_ms': 0.0,
+            'espera_max_ms': 0.0,
+            'agotado': 0,
+            'creadas': 0,
+            'recicladas': 0,
+            'descartadas': 0,
         }
-    
-    def get_connection(self):
-        """Obtiene una conexión a la base de datos MySQL"""
+
+    def _cerrar(self, conexion):
+        self._creada.pop(id(conexion), None)
+        self._preparadas.pop(id(conexion), None)
         try:
-            if self.connection is None or not self.connection.is_connected():
-                self.connection = mysql.connector.connect(**self.config)
-                print("✅ Conexión a MySQL establecida correctamente")
-            return self.connection
-        except Error as e:
-            print(f" Error conectando a MySQL: {e}")
-            return None
-    
-    def close_connection(self):
-        """Cierra la conexión a la base de datos"""
-        if self.connection and self.connection.is_connected():
-            self.connection.close()
-            self.connection = None
-            print("🔒 Conexión a MySQL cerrada")
-
-# Instancia global de la conexión
-mysql_connection = MySQLConnection()
+            conexion.close()
+        except Exception:
+            pass
 
-def get_db():
-    return mysql.connector.connect(
-        host='localhost',
-        user='root',
-        password='000000', 
-        database='dbcaprichos',
-        port=3307
-    )
-
-def close_db():
-    """Función para cerrar la conexión desde otros archivos"""
-    mysql_connection.close_connection()
-
-def execute_query(query, params=None):
-    """Ejecuta una consulta SQL y devuelve los resultados"""
-    connection = get_db()
-    if connection:
+    # Conexión libre y sana, o None si hay que crear una nueva (llamar con _cond tomado)
+    def _tomar_libre(self):
+        ahora = time.monotonic()
+        while self._libres:
+            conexion, creada, ultimo_uso = self._libres.pop()
+            if ahora - creada > self.max_vida:
+                self._abiertas -= 1
+                self.contadores['recicladas'] += 1
+                self._cerrar(conexion)
+                continue
+            if ahora - ultimo_uso > self.ping_tras and not self._viva(conexion):
+                self._abiertas -= 1
+                self.contadores['descartadas'] += 1
+                self._cerrar(conexion)
+                continue
+            return conexion
+        return None
+
+    @staticmethod
+    def _viva(conexion):
         try:
+            return conexion.is_connected()
+        except Exception:
+            return False
+
+    def obtener(self):
+        """Entrega una conexión del pool (esperando si están todas en uso)"""
+        inicio = time.monotonic()
+        limite = inicio + self.espera_max
+        espero = False
+        with self._cond:
+            while True:
+                conexion = self._tomar_libre()
+                if conexion is not None or self._abiertas < self.tamano:
+                    break
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    self.contadores['agotado'] += 1
+                    raise PoolError('No hay conexiones disponibles en el pool')
+                espero = True
+                self._cond.wait(restante)
+            nueva = conexion is None
+            if nueva:
+                self._abiertas += 1
+        if nueva:
+            # Se conecta fuera del candado para no bloquear a los demás hilos
+            try:
+                conexion = self._conectar()
+            except Exception:
+                with self._cond:
+                    self._abiertas -= 1
+                    self._cond.notify()
+                raise
+        esperado = (time.monotonic() - inicio) * 1000
+        with self._cond:
+            c = self.contadores
+            c['entregas'] += 1
+            c['en_uso'] += 1
+            if nueva:
+                c['creadas'] += 1
+                self._creada[id(conexion)] = time.monotonic()
+            if espero:
+                c['esperas'] += 1
+            c['espera_total_ms'] += esperado
+            c['espera_max_ms'] = max(c['espera_max_ms'], round(esperado, 3))
+        return conexion
+
+    def devolver(self, conexion):
+        """Devuelve una conexión al pool; si quedó rota se descarta"""
+        sana = self._viva(conexion)
+        if sana:
+            try:
+                conexion.rollback()  # descarta una transacción que haya quedado abierta
+            except Exception:
+                sana = False
+        with self._cond:
+            self.contadores['en_uso'] -= 1
+            if sana:
+                creada = self._creada.get(id(conexion), time.monotonic())
+                self._libres.append((conexion, creada, time.monotonic()))
+            else:
+                self._abiertas -= 1
+                self.contadores['descartadas'] += 1
+                self._cerrar(conexion)
+            self._cond.notify()
+
+    def cursor_preparado(self, conexion, query):
+        """Cursor con la sentencia ya preparada en el servidor para esta conexión.
+        Devuelve (query, cursor): hay que ejecutar con ese mismo objeto query,
+        porque mysql.connector solo reutiliza la sentencia si es idéntico."""
+        cache = self._preparadas.setdefault(id(conexion), OrderedDict())
+        guardada = cache.get(query)
+        if guardada is not None:
+            cache.move_to_end(query)
+            return guardada
+        guardada = cache[query] = (query, conexion.cursor(prepared=True))
+        if len(cache) > self.max_preparadas:
+            _, (_, cursor) = cache.popitem(last=False)
+            try:
+                cursor.close()  # libera la sentencia en el servidor
+            except Exception:
+                pass
+        return guardada
+
+    @contextmanager
+    def conexion(self):
+        """Uso fuera de una petición: with pool.conexion() as conn: ..."""
+        conexion = self.obtener()
+        try:
+            yield conexion
+        finally:
+            self.devolver(conexion)
+
+    def estadisticas(self):
+        """Contadores de uso y espera del pool"""
+        with self._cond:
+            datos = dict(self.contadores)
+            datos['abiertas'] = self._abiertas
+            datos['libres'] = len(self._libres)
+            datos['tamano'] = self.tamano
+        datos['espera_media_ms'] = round(datos['espera_total_ms'] / datos['entregas'], 3) if datos['entregas'] else 0.0
+        return datos
+
+    def cerrar_todo(self):
+        """Cierra las conexiones libres (p. ej. al apagar)"""
+        with self._cond:
+            while self._libres:
+                conexion, _, _ = self._libres.pop()
+                self._abiertas -= 1
+                self._cerrar(conexion)
+
+# Instancia global del pool
+pool = PoolConexiones(
+    DB_CONFIG,
+    tamano=int(os.getenv('DB_POOL_SIZE', '5')),
+    max_vida=float(os.getenv('DB_POOL_MAX_VIDA', '1800')),
+    espera_max=float(os.getenv('DB_POOL_TIMEOUT', '10')),
+    ping_tras=float(os.getenv('DB_POOL_PING', '30')),
+)
+
+def get_db():
+    """Conexión de la petición actual: se toma del pool la primera vez y
+    close_db() la devuelve al terminar. Fuera de una petición usar pool.conexion()."""
+    if not has_app_context():
+        raise RuntimeError('get_db() requiere un contexto de aplicación; usa pool.conexion()')
+    if 'db_conn' not in g:
+        g.db_conn = pool.obtener()
+    return g.db_conn
+
+def close_db(error=None):
+    """Devuelve al pool la conexión de la petición, si se usó"""
+    conexion = g.pop('db_conn', None) if has_app_context() else None
+    if conexion is not None:
+        pool.devolver(conexion)
+
+@contextmanager
+def _conexion_actual():
+    # Dentro de una petición se reutiliza su conexión; fuera, se pide una al pool
+    if has_app_context():
+        yield get_db()
+    else:
+        with pool.conexion() as conexion:
+            yield conexion
+
+# Filas del cursor como diccionarios (los cursores preparados devuelven tuplas)
+def _como_dicts(cursor, filas):
+    columnas = cursor.column_names
+    return [dict(zip(columnas, fila)) for fila in filas]
+
+def execute_query(query, params=None, preparada=False):
+    """Ejecuta una consulta SQL y devuelve los resultados.
+    Con preparada=True la sentencia se prepara una vez por conexión y se
+    reutiliza en las siguientes llamadas con la misma consulta."""
+    try:
+        with _conexion_actual() as connection:
+            if preparada:
+                query, cursor = pool.cursor_preparado(connection, query)
+                cursor.execute(query, params)
+                if cursor.with_rows:
+                    return _como_dicts(cursor, cursor.fetchall())
+                connection.commit()
+                return True
             cursor = connection.cursor(dictionary=True)
+            try:
+                cursor.execute(query, params)
+                if cursor.with_rows:
+                    return cursor.fetchall()
+                connection.commit()
+                return True
+            finally:
+                cursor.close()
+    except Error as e:
+        print(f" Error ejecutando consulta: {e}")
+        return None
+
+def iterar_consulta(query, params=None, tamano_lote=1000):
+    """Generador que entrega las filas (dict) de un SELECT por bloques de
+    `tamano_lote` con fetchmany, sin cargar el resultado completo en memoria.
+    Usa una conexión propia del pool mientras dura la iteración, porque un
+    cursor sin buffer ocupa la conexión hasta leer la última fila."""
+    with pool.conexion() as connection:
+        cursor = connection.cursor(dictionary=True, buffered=False)
+        terminado = False
+        try:
             cursor.execute(query, params)
-            if query.strip().upper().startswith('SELECT'):
-                results = cursor.fetchall()
+            while True:
+                filas = cursor.fetchmany(tamano_lote)
+                if not filas:
+                    break
+                yield from filas
+            terminado = True
+        finally:
+            if terminado:
                 cursor.close()
-                return results
             else:
-                connection.commit()
-                cursor.close()
-                return True
-        except Error as e:
-            print(f" Error ejecutando consulta: {e}")
-            return None
-    return None
+                # Si se deja de iterar a medias quedan filas sin leer: es más
+                # barato cerrar la conexión (el pool la descarta) que leerlas todas
+                connection.close()
+
+def ejecutar_lote(query, filas, tamano_lote=500, preparada=False):
+    """Ejecuta una escritura con muchos juegos de parámetros usando executemany,
+    en transacciones de `tamano_lote` filas. Con el cursor normal los INSERT se
+    envían como un único INSERT de varias filas; con `preparada=True` el
+    conector ejecuta la sentencia preparada fila a fila (una ida y vuelta por
+    fila, dentro de la misma transacción), así que para cargas grandes conviene
+    el cursor normal. `filas` puede ser cualquier iterable, incluso un
+    generador. Devuelve el total de filas afectadas, o None si hubo un error;
+    los lotes anteriores al error quedan confirmados."""
+    total = 0
+    try:
+        with _conexion_actual() as connection:
+            if preparada:
+                query, cursor = pool.cursor_preparado(connection, query)
+            else:
+                cursor = connection.cursor()
+            try:
+                lote = []
+                for fila in filas:
+                    lote.append(fila)
+                    if len(lote) >= tamano_lote:
+                        total += _ejecutar_transaccion(connection, cursor, query, lote)
+                        lote = []
+                if lote:
+                    total += _ejecutar_transaccion(connection, cursor, query, lote)
+            finally:
+                if not preparada:
+                    cursor.close()
+        return total
+    except Error as e:
+        print(f" Error ejecutando lote: {e}")
+        return None
+
+def _ejecutar_transaccion(connection, cursor, query, lote):
+    connection.start_transaction()
+    try:
+        cursor.executemany(query, lote)
+        connection.commit()
+    except Error:
+        connection.rollback()
+        raise
+    return cursor.rowcount
@@ -0,0 +1,80 @@
+from models import db, Usuario
+from sqlalchemy import bindparam
+from datetime import datetime
+import atexit
+import threading
+
+# Buffer de escritura diferida para usuarios.ultimo_acceso. El inicio de
+# sesión solo anota la fecha en memoria; un hilo la guarda cada 'intervalo'
+# segundos con un único UPDATE por lotes (executemany). Si un usuario entra
+# varias veces entre volcados solo se escribe la última fecha. Como no pasa
+# por el ORM no genera entradas en el registro de cambios.
+class BufferAccesos:
+
+    def __init__(self, app, intervalo=10.0):
+        self.app = app
+        self.intervalo = intervalo
+        self._pendientes = {}  # id de usuario -> fecha del último acceso
+        self._lock = threading.Lock()
+        self._detener = threading.Event()
+        self._hilo = None
+        self.metricas = {'registrados': 0, 'escritos': 0, 'volcados': 0, 'errores': 0}
+
+    # Hilo perezoso y por proceso, como en EscritorAuditoria
+    def _asegurar_hilo(self):
+        if self._hilo is not None and self._hilo.is_alive():
+            return
+        with self._lock:
+            if self._hilo is None or not self._hilo.is_alive():
+                self._hilo = threading.Thread(target=self._bucle, name='buffer-accesos', daemon=True)
+                self._hilo.start()
+                atexit.register(self.detener)
+
+    def registrar(self, user_id, fecha=None):
+        self._asegurar_hilo()
+        with self._lock:
+            self._pendientes[user_id] = fecha or datetime.utcnow()
+            self.metricas['registrados'] += 1
+
+    def _bucle(self):
+        while not self._detener.wait(self.intervalo):
+            self.volcar()
+
+    # Escribe todo lo pendiente; devuelve el número de usuarios actualizados
+    def volcar(self):
+        with self._lock:
+            lote, self._pendientes = self._pendientes, {}
+        if not lote:
+            return 0
+        filas = [{'b_id': uid, 'b_fecha': fecha} for uid, fecha in lote.items()]
+        sentencia = (Usuario.__table__.update()
+                     .where(Usuario.__table__.c.id == bindparam('b_id'))
+                     .values(ultimo_acceso=bindparam('b_fecha')))
+        try:
+            with self.app.app_context():
+                db.session.execute(sentencia, filas)
+                db.session.commit()
+        except Exception as e:
+            print(f"Error guardando últimos accesos: {e}")
+            # Se devuelven al buffer salvo que ya haya llegado una fecha más nueva
+            with self._lock:
+                for uid, fecha in lote.items():
+                    self._pendientes.setdefault(uid, fecha)
+                self.metricas['errores'] += 1
+            return 0
+        with self._lock:
+            self.metricas['escritos'] += len(filas)
+            self.metricas['volcados'] += 1
+        return len(filas)
+
+    def detener(self, timeout=10):
+        self._detener.set()
+        if self._hilo is not None and self._hilo.is_alive():
+            self._hilo.join(timeout)
+        self.volcar()
+
+    def estado(self):
+        with self._lock:
+            datos = dict(self.metricas)
+            datos['pendientes'] = len(self._pendientes)
+        return datos
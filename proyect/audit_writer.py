@@ -0,0 +1,132 @@
+from journal import registro_producto
+from datetime import datetime
+import atexit
+import os
+import queue
+import threading
+import time
+
+# Destino de texto plano: una línea id|nombre|cantidad|precio|imagen|fecha por registro
+class SinkTxt:
+
+    def __init__(self, ruta='templates/datos/dato.txt'):
+        self.ruta = ruta
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+
+    def escribir_lote(self, registros):
+        lineas = []
+        for r in registros:
+            fecha = datetime.fromisoformat(r['fecha_creacion']).strftime('%Y-%m-%d %H:%M:%S')
+            lineas.append(f"{r['id']}|{r['nombre']}|{r['cantidad']}|{r['precio']}|{r['imagen']}|{fecha}\n")
+        with open(self.ruta, 'a', encoding='utf-8') as f:
+            f.write(''.join(lineas))
+            f.flush()
+            os.fsync(f.fileno())
+
+# Escritor en segundo plano de los eventos de productos. Las peticiones solo
+# encolan el registro; un hilo los agrupa y los vuelca en todos los destinos
+# cuando se juntan 'lote_max' eventos o pasan 'intervalo' segundos, con un
+# único fsync por destino y lote. Los pendientes se vacían al apagar.
+class EscritorAuditoria:
+
+    def __init__(self, destinos, lote_max=100, intervalo=1.0, cola_max=10000):
+        self.destinos = destinos
+        self.lote_max = lote_max
+        self.intervalo = intervalo
+        self.cola = queue.Queue(maxsize=cola_max)
+        self.metricas = {
+            'eventos_escritos': 0,
+            'lotes': 0,
+            'errores': 0,
+            'descartados': 0,
+            'ultima_latencia_ms': 0.0,
+            'max_latencia_ms': 0.0,
+            'ultimo_lote': 0,
+        }
+        # Eventos ya sacados de la cola que esperan a completar su lote
+        self._en_lote = 0
+        self._detener = threading.Event()
+        self._hilo = None
+        self._lock = threading.Lock()
+
+    # Arranca el hilo escritor (perezoso y por proceso, para convivir con fork)
+    def _asegurar_hilo(self):
+        if self._hilo is not None and self._hilo.is_alive():
+            return
+        with self._lock:
+            if self._hilo is None or not self._hilo.is_alive():
+                self._hilo = threading.Thread(target=self._bucle, name='escritor-auditoria', daemon=True)
+                self._hilo.start()
+                atexit.register(self.detener)
+
+    # Encola una copia de los datos del producto; no toca el disco
+    def registrar(self, producto):
+        self._asegurar_hilo()
+        try:
+            self.cola.put(registro_producto(producto), timeout=1)
+        except queue.Full:
+            with self._lock:
+                self.metricas['descartados'] += 1
+            print(f"Cola de auditoría llena: se descarta el producto {producto.id}")
+
+    def _bucle(self):
+        while not self._detener.is_set() or not self.cola.empty():
+            try:
+                primero = self.cola.get(timeout=self.intervalo)
+            except queue.Empty:
+                continue
+            lote = [primero]
+            self._en_lote = 1
+            limite = time.monotonic() + self.intervalo
+            while len(lote) < self.lote_max:
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    break
+                try:
+                    lote.append(self.cola.get(timeout=restante))
+                    self._en_lote = len(lote)
+                except queue.Empty:
+                    break
+            self._volcar(lote)
+            self._en_lote = 0
+
+    def _volcar(self, lote):
+        inicio = time.perf_counter()
+        for destino in self.destinos:
+            try:
+                destino.escribir_lote(lote)
+            except Exception as e:
+                with self._lock:
+                    self.metricas['errores'] += 1
+                print(f"Error escribiendo auditoría en {type(destino).__name__}: {e}")
+        latencia = (time.perf_counter() - inicio) * 1000
+        with self._lock:
+            m = self.metricas
+            m['eventos_escritos'] += len(lote)
+            m['lotes'] += 1
+            m['ultimo_lote'] = len(lote)
+            m['ultima_latencia_ms'] = round(latencia, 3)
+            m['max_latencia_ms'] = round(max(m['max_latencia_ms'], latencia), 3)
+
+    # Detiene el hilo tras escribir todo lo pendiente
+    def detener(self, timeout=10):
+        self._detener.set()
+        if self._hilo is not None and self._hilo.is_alive():
+            self._hilo.join(timeout)
+        # Si el hilo no llegó a vaciar la cola, se escribe aquí mismo
+        pendientes = []
+        while True:
+            try:
+                pendientes.append(self.cola.get_nowait())
+            except queue.Empty:
+                break
+        if pendientes:
+            self._volcar(pendientes)
+
+    # Métricas para monitoreo: profundidad de la cola y latencia de volcado
+    def estado(self):
+        with self._lock:
+            datos = dict(self.metricas)
+        datos['profundidad_cola'] = self.cola.qsize() + self._en_lote
+        datos['activo'] = self._hilo is not None and self._hilo.is_alive()
+        return datos
@@ -0,0 +1,134 @@
+from models import db, RegistroCambio, usar_principal
+from datetime import datetime, timedelta
+import threading
+import time
+
+# Clase que mantiene sincronizadas las cachés en memoria de cada worker
+# leyendo el registro de cambios compartido en la base de datos
+class SincronizadorCambios:
+    # Versión = id del último RegistroCambio aplicado en este proceso
+    # Suscriptores por entidad: {'producto': [callback(lista_de_cambios), ...]}
+    # Intervalo mínimo (segundos) entre consultas al registro
+    # Huecos: ids menores que la versión que todavía no se vieron. El
+    # autoincremental se asigna al insertar pero la fila se ve al confirmar,
+    # así que una transacción lenta puede aparecer después de otra con un id
+    # mayor. Cada hueco se vuelve a consultar durante 'espera_huecos'
+    # segundos; pasado ese plazo se da por perdido (rollback).
+
+    # Ids consultados como posibles huecos al tomar la versión de partida
+    VENTANA_HUECOS = 100
+    # Saltos mayores no se anotan uno a uno (p. ej. tras una poda o un
+    # cambio de auto_increment); solo los últimos ids antes del salto
+    MAX_HUECO = 1000
+    # Filas borradas por cada sentencia de la poda
+    LOTE_PODA = 5000
+
+    def __init__(self, intervalo=0.0, espera_huecos=60.0):
+        self.version = 0
+        self.intervalo = intervalo
+        self.espera_huecos = espera_huecos
+        self.suscriptores = {}
+        self.huecos = {}             # id -> momento en que se detectó
+        self._ultimo_chequeo = 0.0
+        self._lock = threading.Lock()
+
+    # Registra una función que aplica los cambios de una entidad
+    # (puede haber varias por entidad)
+    def suscribir(self, entidad, callback):
+        self.suscriptores.setdefault(entidad, []).append(callback)
+
+    # Toma como punto de partida la última versión existente; debe llamarse
+    # antes de cargar las cachés para no perder cambios concurrentes.
+    # Los ids que faltan justo por debajo pueden ser transacciones aún sin
+    # confirmar, así que quedan anotados como huecos.
+    # Los errores se propagan para que el calentamiento lo reintente.
+    def marcar_version_actual(self):
+        with self._lock:
+            ultimo = db.session.query(db.func.max(RegistroCambio.id)).scalar() or 0
+            desde = max(0, ultimo - self.VENTANA_HUECOS)
+            ids = [id for (id,) in (db.session.query(RegistroCambio.id)
+                                    .filter(RegistroCambio.id > desde)
+                                    .order_by(RegistroCambio.id))]
+            self.huecos = {}
+            self._anotar_huecos(desde, ids, time.monotonic())
+            self.version = ultimo
+            return self.version
+
+    # Anota los ids que faltan entre 'desde' y cada id de la lista (ordenada)
+    def _anotar_huecos(self, desde, ids, ahora):
+        anterior = desde
+        for id in ids:
+            for hueco in range(max(anterior + 1, id - self.MAX_HUECO), id):
+                self.huecos[hueco] = ahora
+            anterior = id
+
+    # Lee los cambios posteriores a la versión local, más los huecos
+    # pendientes, y los reparte entre los suscriptores. Si no hay cambios ni
+    # huecos es una sola consulta por índice primario.
+    def sincronizar(self, forzar=False):
+        ahora = time.monotonic()
+        if not forzar and ahora - self._ultimo_chequeo < self.intervalo:
+            return 0
+        with self._lock:
+            self._ultimo_chequeo = ahora
+            self.huecos = {id: visto for id, visto in self.huecos.items()
+                           if ahora - visto < self.espera_huecos}
+            filtro = RegistroCambio.id > self.version
+            if self.huecos:
+                filtro = db.or_(filtro, RegistroCambio.id.in_(list(self.huecos)))
+            cambios = (RegistroCambio.query
+                       .filter(filtro)
+                       .order_by(RegistroCambio.id)
+                       .all())
+            if not cambios:
+                return 0
+            nuevos = [c.id for c in cambios if c.id > self.version]
+            self._anotar_huecos(self.version, nuevos, ahora)
+            for c in cambios:
+                self.huecos.pop(c.id, None)
+            por_entidad = {}
+            for c in cambios:
+                por_entidad.setdefault(c.entidad, []).append(c)
+            for entidad, lista in por_entidad.items():
+                for callback in self.suscriptores.get(entidad, []):
+                    callback(lista)
+            if nuevos:
+                self.version = nuevos[-1]
+            return len(cambios)
+
+    # Borra por lotes las entradas con más de 'retencion' segundos. Un worker
+    # solo lee entradas posteriores a su versión (y los huecos recientes),
+    # así que nunca se borra nada por encima de ella.
+    def podar(self, retencion):
+        usar_principal()
+        limite = datetime.now() - timedelta(seconds=retencion)
+        borradas = 0
+        while True:
+            ids = [id for (id,) in (db.session.query(RegistroCambio.id)
+                                    .filter(RegistroCambio.fecha < limite,
+                                            RegistroCambio.id <= self.version)
+                                    .order_by(RegistroCambio.id)
+                                    .limit(self.LOTE_PODA))]
+            if not ids:
+                return borradas
+            borradas += (RegistroCambio.query
+                         .filter(RegistroCambio.id <= ids[-1],
+                                 RegistroCambio.fecha < limite)
+                         .delete(synchronize_session=False))
+            db.session.commit()
+            if len(ids) < self.LOTE_PODA:
+                return borradas
+
+    # Lanza un hilo que poda el registro cada 'intervalo' segundos
+    def iniciar_poda_periodica(self, app, intervalo, retencion):
+        def bucle():
+            while True:
+                time.sleep(intervalo)
+                try:
+                    with app.app_context():
+                        self.podar(retencion)
+                except Exception as e:
+                    print(f"Error podando el registro de cambios: {e}")
+        hilo = threading.Thread(target=bucle, name='poda-cambios', daemon=True)
+        hilo.start()
+        return hilo
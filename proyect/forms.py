@@ -2,7 +2,7 @@ from flask_wtf import FlaskForm
 from flask_wtf.file import FileField, FileAllowed, FileSize
 from wtforms import StringField, IntegerField, DecimalField, SubmitField, PasswordField, EmailField, BooleanField
 from wtforms.validators import DataRequired, NumberRange, Length, Email, EqualTo, ValidationError
-from models import Usuario
+from user_availability import disponibilidad
 
 # Formulario para productos con validaciones para cada campo
 class ProductoForm(FlaskForm):
@@ -40,14 +40,14 @@ class RegistroForm(FlaskForm):
     ])
     submit = SubmitField('Registrarse')
 
+    # Al registrar se consulta siempre la base: el filtro de Bloom no
+    # reproduce la collation entera y un negativo podría no serlo
     def validate_username(self, username):
-        usuario = Usuario.get_by_username(username.data)
-        if usuario:
+        if not disponibilidad.username_disponible(username.data, confirmar=True):
             raise ValidationError('Este nombre de usuario ya está en uso. Elige otro.')
 
     def validate_email(self, email):
-        usuario = Usuario.get_by_email(email.data)
-        if usuario:
+        if not disponibilidad.email_disponible(email.data, confirmar=True):
             raise ValidationError('Este correo electrónico ya está registrado. Usa otro.')
 
 # Formulario para inicio de sesión
@@ -0,0 +1,112 @@
+from PIL import Image, ImageOps
+import os
+import threading
+import uuid
+
+# Variantes de tamaño disponibles: nombre -> (tamaño máximo, recortar al tamaño exacto)
+VARIANTES = {
+    'mini': ((120, 120), True),     # miniaturas de 60x60 en el listado (x2 para pantallas HiDPI)
+    'media': ((400, 300), False),   # vista previa del formulario
+    'grande': ((1200, 900), False), # modal de vista ampliada
+}
+
+# Caché en disco de variantes redimensionadas de las imágenes subidas.
+# Las variantes se generan la primera vez que se piden y se expulsan las
+# menos usadas (LRU por fecha de modificación) al superar max_bytes.
+class CacheImagenes:
+
+    def __init__(self, carpeta, origen, max_bytes=200 * 1024 * 1024):
+        self.carpeta = carpeta
+        self.origen = origen
+        self.max_bytes = max_bytes
+        # Estimación de lo ocupado; se recalcula al recorrer la carpeta
+        self._bytes = None
+        self._lock = threading.Lock()
+        os.makedirs(self.carpeta, exist_ok=True)
+
+    # Ruta del archivo original subido
+    def ruta_origen(self, filename):
+        return os.path.join(self.origen, filename)
+
+    def _ruta_variante(self, variante, filename, formato):
+        base = filename.rsplit('.', 1)[0]
+        return os.path.join(self.carpeta, variante, f'{base}.{formato.lower()}')
+
+    # Devuelve la ruta de la variante pedida, generándola si hace falta.
+    # formato es 'JPEG' o 'WEBP'. Devuelve None si el original no existe.
+    def obtener(self, variante, filename, formato='JPEG'):
+        if variante not in VARIANTES:
+            raise KeyError(variante)
+        origen = self.ruta_origen(filename)
+        ruta = self._ruta_variante(variante, filename, formato)
+        if not os.path.exists(origen):
+            if os.path.exists(ruta):
+                os.remove(ruta)
+            return None
+        try:
+            # Acierto: se actualiza la fecha para el orden LRU
+            os.utime(ruta)
+            return ruta
+        except FileNotFoundError:
+            pass
+        self._generar(origen, ruta, variante, formato)
+        self._registrar_escritura(ruta)
+        return ruta
+
+    def _generar(self, origen, ruta, variante, formato):
+        tamano, recortar = VARIANTES[variante]
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        with Image.open(origen) as img:
+            if img.mode not in ('RGB', 'L'):
+                img = img.convert('RGB')
+            if recortar:
+                img = ImageOps.fit(img, tamano, Image.Resampling.LANCZOS)
+            else:
+                img.thumbnail(tamano, Image.Resampling.LANCZOS)
+            # Archivo temporal + os.replace: otro worker nunca ve un archivo a medias
+            temporal = f'{ruta}.{uuid.uuid4().hex}.tmp'
+            if formato == 'WEBP':
+                img.save(temporal, 'WEBP', quality=80, method=4)
+            else:
+                img.save(temporal, 'JPEG', quality=85, optimize=True, progressive=True)
+        os.replace(temporal, ruta)
+
+    def _registrar_escritura(self, ruta):
+        with self._lock:
+            if self._bytes is None:
+                self._bytes = self._ocupado()
+            else:
+                self._bytes += os.path.getsize(ruta)
+            if self._bytes > self.max_bytes:
+                self._expulsar(conservar=ruta)
+
+    def _archivos(self):
+        for raiz, _, nombres in os.walk(self.carpeta):
+            for nombre in nombres:
+                ruta = os.path.join(raiz, nombre)
+                try:
+                    info = os.stat(ruta)
+                except FileNotFoundError:
+                    continue
+                yield ruta, info
+
+    def _ocupado(self):
+        return sum(info.st_size for _, info in self._archivos())
+
+    # Borra las variantes usadas hace más tiempo hasta quedar en el 90% del
+    # presupuesto, salvo la que se acaba de generar y se va a servir
+    def _expulsar(self, conservar=None):
+        archivos = sorted(self._archivos(), key=lambda a: a[1].st_mtime)
+        total = sum(info.st_size for _, info in archivos)
+        objetivo = self.max_bytes * 0.9
+        for ruta, info in archivos:
+            if total <= objetivo:
+                break
+            if ruta == conservar:
+                continue
+            try:
+                os.remove(ruta)
+                total -= info.st_size
+            except FileNotFoundError:
+                pass
+        self._bytes = total
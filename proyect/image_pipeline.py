@@ -0,0 +1,176 @@
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from PIL import Image
+import atexit
+import hashlib
+import json
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+
+# Redimensiona y recodifica una imagen como JPEG y la guarda en carpeta_destino
+# con el hash de su contenido como nombre, de modo que la misma imagen se
+# almacena una sola vez. Devuelve el nombre del archivo final.
+# Se ejecuta en un proceso hijo del pool, por eso es una función de módulo.
+def procesar_imagen(ruta_origen, carpeta_destino, tamano):
+    temporal = os.path.join(carpeta_destino, f'.{uuid.uuid4().hex}.tmp')
+    try:
+        with Image.open(ruta_origen) as img:
+            if img.mode in ('RGBA', 'LA', 'P'):
+                img = img.convert('RGB')
+            img.thumbnail(tamano, Image.Resampling.LANCZOS)
+            img.save(temporal, 'JPEG', quality=85, optimize=True)
+        filename = f'{hash_archivo(temporal)[:32]}.jpg'
+        # Si ya existía es idéntico: reemplazarlo es inofensivo y lo recrea
+        # si otro proceso lo acababa de borrar
+        os.replace(temporal, os.path.join(carpeta_destino, filename))
+        return filename
+    finally:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+
+# SHA-256 del contenido de un archivo, leído por bloques
+def hash_archivo(ruta):
+    h = hashlib.sha256()
+    with open(ruta, 'rb') as f:
+        for bloque in iter(lambda: f.read(64 * 1024), b''):
+            h.update(bloque)
+    return h.hexdigest()
+
+# Estado de los trabajos guardado en archivos JSON (uno por producto) para
+# que cualquier worker de gunicorn pueda responder a la consulta del formulario
+class EstadoTrabajos:
+
+    def __init__(self, carpeta):
+        self.carpeta = carpeta
+        os.makedirs(self.carpeta, exist_ok=True)
+
+    def _ruta(self, producto_id):
+        return os.path.join(self.carpeta, f'{int(producto_id)}.json')
+
+    # Escribe el estado de forma atómica (archivo temporal + os.replace)
+    def guardar(self, producto_id, **estado):
+        estado['actualizado'] = time.time()
+        temporal = f'{self._ruta(producto_id)}.{uuid.uuid4().hex}.tmp'
+        with open(temporal, 'w', encoding='utf-8') as f:
+            json.dump(estado, f, ensure_ascii=False)
+        os.replace(temporal, self._ruta(producto_id))
+
+    def leer(self, producto_id):
+        try:
+            with open(self._ruta(producto_id), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+# Pipeline de imágenes en segundo plano: el producto se guarda enseguida y la
+# imagen se procesa en un pool de procesos; al terminar se llama a
+# al_terminar(producto_id, nombre_archivo) dentro de un contexto de la app.
+# Los resultados que no se usan se entregan a al_descartar(nombre_archivo),
+# que decide si el archivo (compartido por contenido) puede borrarse.
+class ProcesadorImagenes:
+
+    def __init__(self, app, al_terminar, al_descartar, carpeta_estado, procesos=2, tamano=(400, 300)):
+        self.app = app
+        self.al_terminar = al_terminar
+        self.al_descartar = al_descartar
+        self.estado = EstadoTrabajos(carpeta_estado)
+        self.procesos = procesos
+        self.tamano = tamano
+        self._pool = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    # El pool se crea de forma perezosa y por proceso: los workers de gunicorn
+    # se crean con fork y no deben heredar el pool del proceso maestro.
+    # Los hijos se lanzan con 'spawn': el worker web ya tiene hilos (auditoría,
+    # instantánea, callbacks del pool) y un fork podría copiar un lock tomado.
+    # Con 'spawn' el hijo solo importa este módulo para ejecutar procesar_imagen.
+    def _obtener_pool(self):
+        with self._lock:
+            if self._pool is None or self._pid != os.getpid():
+                self._pool = ProcessPoolExecutor(max_workers=self.procesos,
+                                                 mp_context=multiprocessing.get_context('spawn'))
+                self._pid = os.getpid()
+                atexit.register(self._pool.shutdown, wait=True)
+            return self._pool
+
+    # Descarta un pool roto (p. ej. un hijo murió por falta de memoria o un
+    # fallo de PIL): el siguiente envío crea uno nuevo
+    def _descartar_pool(self, pool):
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+        pool.shutdown(wait=False)
+
+    # Envía el trabajo (reintentando una vez con un pool nuevo si el actual
+    # está roto) y devuelve el pool usado y el futuro
+    def _enviar_al_pool(self, *args):
+        pool = self._obtener_pool()
+        try:
+            return pool, pool.submit(procesar_imagen, *args)
+        except BrokenProcessPool:
+            self._descartar_pool(pool)
+            pool = self._obtener_pool()
+            return pool, pool.submit(procesar_imagen, *args)
+
+    # Encola el procesamiento de una imagen ya guardada en ruta_origen.
+    # Un envío posterior para el mismo producto deja obsoleto al anterior.
+    # Si no se puede encolar, el estado queda en error (el formulario deja de
+    # consultar) y la excepción se propaga.
+    def enviar(self, producto_id, ruta_origen, carpeta_destino):
+        token = uuid.uuid4().hex
+        self.estado.guardar(producto_id, estado='pendiente', token=token)
+        try:
+            pool, futuro = self._enviar_al_pool(ruta_origen, carpeta_destino, self.tamano)
+        except Exception:
+            self.estado.guardar(producto_id, estado='error', token=token,
+                                mensaje='No se pudo encolar la imagen')
+            raise
+        futuro.add_done_callback(
+            lambda f: self._terminar(f, producto_id, token, ruta_origen, pool)
+        )
+        return token
+
+    # Se ejecuta en un hilo del proceso web cuando el proceso hijo termina
+    def _terminar(self, futuro, producto_id, token, ruta_origen, pool):
+        try:
+            os.remove(ruta_origen)
+        except OSError:
+            pass
+        error = futuro.exception()
+        if isinstance(error, BrokenProcessPool):
+            self._descartar_pool(pool)
+        actual = self.estado.leer(producto_id)
+        if not actual or actual.get('token') != token:
+            # Llegó otra imagen para el mismo producto: este resultado se descarta
+            if error is None:
+                self._descartar(futuro.result())
+            return
+        if error is not None:
+            print(f"Error procesando imagen: {error}")
+            self.estado.guardar(producto_id, estado='error', token=token,
+                                mensaje='Error al procesar la imagen')
+            return
+        filename = futuro.result()
+        try:
+            with self.app.app_context():
+                aplicada = self.al_terminar(producto_id, filename)
+        except Exception as e:
+            print(f"Error guardando imagen procesada: {e}")
+            aplicada = False
+        if aplicada:
+            self.estado.guardar(producto_id, estado='listo', token=token, imagen=filename)
+        else:
+            self._descartar(filename)
+            self.estado.guardar(producto_id, estado='error', token=token,
+                                mensaje='El producto ya no existe')
+
+    def _descartar(self, filename):
+        try:
+            with self.app.app_context():
+                self.al_descartar(filename)
+        except Exception as e:
+            print(f"Error descartando imagen: {e}")
@@ -1,36 +1,374 @@
-from models import db, Producto
+from models import db, Producto, usar_principal
+from models import RegistroCambio
+from search_index import IndiceTrigramas, normalizar, clave_relevancia
+from sorted_index import IndiceOrdenado, paginar
+from inventory_stats import EstadisticasInventario
+from datetime import datetime, timedelta
+from collections import namedtuple
+from bisect import bisect_left
+from contextlib import nullcontext
+import base64
+import heapq
+import json
 import os
+import threading
+import time
 from werkzeug.utils import secure_filename
 import uuid
-from PIL import Image
+from image_pipeline import procesar_imagen
+
+# Resultado de una consulta paginada: productos de la página, cursores opacos
+# hacia las páginas vecinas (None si no existen) y total de coincidencias
+Pagina = namedtuple('Pagina', ['productos', 'anterior', 'siguiente', 'total'])
+
+# Resultado de un ajuste de stock: cantidad resultante por id ajustado y las
+# líneas rechazadas ({'linea', 'id', 'motivo'}, motivo 'sin_stock' o 'no_existe')
+AjusteStock = namedtuple('AjusteStock', ['cantidades', 'fallidas'])
+
+# Copia inmutable de un producto tal como la guarda la caché. No depende de
+# ninguna sesión: leerla nunca lanza consultas ni falla por estar desvinculada,
+# y ocupa mucho menos que una instancia del ORM.
+class RegistroProducto(namedtuple('RegistroProducto', [
+        'id', 'nombre', 'nombre_lower', 'cantidad', 'precio', 'imagen',
+        'fecha_creacion', 'fecha_modificacion'])):
+    __slots__ = ()
+
+    # Columnas que se consultan para construir registros sin pasar por el ORM
+    COLUMNAS = (Producto.id, Producto.nombre, Producto.cantidad, Producto.precio,
+                Producto.imagen, Producto.fecha_creacion, Producto.fecha_modificacion)
+
+    # Crea el registro desde un Producto del ORM o una fila de COLUMNAS
+    @classmethod
+    def desde_modelo(cls, p):
+        return cls(p.id, p.nombre, p.nombre.lower(), p.cantidad, p.precio, p.imagen,
+                   p.fecha_creacion, p.fecha_modificacion)
+
+    get_image_url = Producto.get_image_url
+
+# Catálogo completo en memoria: registros por id, índice de trigramas, un
+# índice ordenado por cada criterio de orden y las estadísticas. Inventario
+# lo modifica bajo su lock; recargar construye uno nuevo y lo reemplaza con
+# una sola asignación, así que nadie ve nunca un catálogo a medio llenar.
+class CatalogoMemoria:
+
+    def __init__(self, ordenes, umbral_stock_bajo, registros=()):
+        self.productos = {}
+        # Índice de trigramas sobre los nombres para búsquedas por subcadena
+        self.indice = IndiceTrigramas()
+        # Un índice ordenado por cada criterio de orden
+        self.ordenes = {nombre: IndiceOrdenado(clave) for nombre, clave in ordenes.items()}
+        # Recuento, valor total, máximos y stock bajo al día con cada cambio
+        self.estadisticas = EstadisticasInventario(umbral_stock_bajo)
+        # Marca de agua: fecha_modificacion más reciente ya reflejada
+        self.marca = None
+        for p in registros:
+            self.agregar(p)
+
+    def __len__(self):
+        return len(self.productos)
+
+    # Registra (o reemplaza) un producto en todas las estructuras
+    def agregar(self, p):
+        self.quitar(p.id)
+        self.productos[p.id] = p
+        self.indice.agregar(p.id, p.nombre)
+        for orden in self.ordenes.values():
+            orden.agregar(p)
+        self.estadisticas.agregar(p)
+        if p.fecha_modificacion and (self.marca is None or p.fecha_modificacion > self.marca):
+            self.marca = p.fecha_modificacion
+
+    # Quita un producto de todas las estructuras y devuelve su registro
+    def quitar(self, id):
+        p = self.productos.pop(id, None)
+        if p is not None:
+            self.indice.eliminar(id)
+            for orden in self.ordenes.values():
+                orden.eliminar(id)
+            self.estadisticas.quitar(id)
+        return p
+
+    def obtener(self, id):
+        return self.productos.get(id)
+
+    # Id del producto con ese nombre en minúsculas (o None), con una
+    # bisección sobre el orden por nombre
+    def id_por_nombre(self, nombre_lower):
+        claves = self.ordenes['nombre'].claves
+        i = bisect_left(claves, (nombre_lower,))
+        if i < len(claves) and claves[i][0] == nombre_lower:
+            return claves[i][-1]
+        return None
+
+    def registros(self):
+        return list(self.productos.values())
+
+    # Claves ascendentes (terminadas en el id) de todo el catálogo
+    def claves(self, orden):
+        return self.ordenes[orden].claves
+
+    # Claves cuyo valor del criterio está entre minimo y maximo (incluidos)
+    def rango(self, orden, minimo=None, maximo=None):
+        return self.ordenes[orden].rango(minimo, maximo)
+
+    def clave(self, orden, id):
+        return self.ordenes[orden].clave(id)
+
+    # Ids cuyo nombre normalizado contiene la consulta (ya normalizada)
+    def candidatos(self, consulta):
+        return self.indice.candidatos(consulta)
+
+    # Claves de relevancia ordenadas de los productos que contienen q
+    def buscar_claves(self, q):
+        return self.indice.buscar_claves(q)
 
 # Clase que gestiona el inventario y operaciones relacionadas
 class Inventario:
-    # Diccionario para acceso rápido a productos {id: Producto}
-    # Set para manejo rápido de nombres y evitar duplicados
+    # Catálogo en memoria con los productos por id y sus índices (CatalogoMemoria)
     # Métodos para carga, creación, actualización, eliminación, y manejo de imágenes
 
     # Configuraciones para manejo de imágenes
     UPLOAD_FOLDER = 'static/uploads'
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
     MAX_FILE_SIZE = 5 * 1024 * 1024  # 5MB
-    IMAGE_SIZE = (400, 300)  # Tamaño para redimensionar imágenes
+    IMAGE_SIZE = (1200, 900)  # Tamaño máximo del original; las variantes salen de aquí
+    # Las imágenes borradas pasan antes por esta carpeta y se eliminan del todo
+    # pasados ESPERA_PAPELERA segundos (ver _delete_image)
+    PAPELERA = os.path.join(UPLOAD_FOLDER, 'papelera')
+    ESPERA_PAPELERA = 3600
+    # Solapamiento al pedir cambios por fecha: cubre la resolución de segundos
+    # de TIMESTAMP y transacciones que confirman después de fijar su hora
+    MARGEN_REFRESCO = timedelta(seconds=2)
+    # Criterios de orden disponibles para los listados (la clave termina en el id)
+    ORDENES = {
+        'nombre': lambda p: (p.nombre_lower, p.id),
+        'precio': lambda p: (p.precio, p.id),
+        'cantidad': lambda p: (p.cantidad, p.id),
+        'fecha_creacion': lambda p: (p.fecha_creacion or datetime.min, p.id),
+    }
+    # Campos con filtro por rango ({campo}_min / {campo}_max); cada uno se
+    # resuelve con el índice ordenado de ORDENES del mismo nombre
+    RANGOS = ('precio', 'cantidad')
+    # Tamaño de página por defecto y máximo para los listados
+    LIMITE_PAGINA = 50
+    LIMITE_PAGINA_MAXIMO = 500
+
+    # Procesador de imágenes en segundo plano (ver image_pipeline); si es None
+    # las imágenes se procesan dentro de la petición
+    procesador = None
 
-    def __init__(self, productos_dict=None):
-        self.productos = productos_dict or {}
-        self.nombres = set(p.nombre.lower() for p in self.productos.values())
+    # Instantánea compartida en disco (ver inventory_snapshot); si es None
+    # todas las lecturas salen de la memoria de este proceso. Con ella, solo
+    # el proceso que la escribe tiene el catálogo en memoria; los demás leen
+    # del mapa y guardan aparte sus propias escrituras hasta verlas publicadas.
+    instantanea = None
+
+    def __init__(self, productos_dict=None, umbral_stock_bajo=9):
+        self.umbral_stock_bajo = umbral_stock_bajo
+        self.catalogo = self._nuevo_catalogo(
+            RegistroProducto.desde_modelo(p) for p in (productos_dict or {}).values())
+        # Protege el catálogo: lo modifican las peticiones y el hilo que
+        # sincroniza, y las lecturas que combinan varios índices lo toman
+        # para no ver un producto a medio aplicar
+        self._lock = threading.RLock()
+        # Id del último cambio de productos del registro reflejado en memoria
+        self.version = 0
+        # El catálogo en memoria está cargado y es la fuente de las lecturas
+        # (sin instantánea siempre lo es)
+        self.en_memoria = False
+        # Escrituras propias de un lector aún no publicadas en la instantánea:
+        # {id: (registro o None si se borró, id de cambio que debe alcanzar)}
+        self._superpuestos = {}
+        # Último cambio de productos del registro tras una escritura propia
+        # (ver _tras_confirmar)
+        self._hasta = 0
+        # (version, modificaciones) de la última instantánea publicada
+        self._publicado = None
+        # Versión del registro que un lector espera ver publicada (ver cargar)
+        self._objetivo_carga = None
+        # Hay escrituras de este proceso que el registro aún no devolvió
+        self._cambios_locales = False
+        # Contador de modificaciones de la caché en este proceso (ver revision)
+        self._modificaciones = 0
+        # Momento de la última purga de la papelera de imágenes
+        self._ultima_purga = 0.0
         self._ensure_upload_folder()
 
-    # Carga productos desde base de datos y retorna instancia de Inventario
+    # Carga productos desde base de datos y retorna instancia de Inventario.
+    # Los errores de la base se propagan: un inventario vacío por un fallo
+    # de conexión no debe confundirse con un catálogo vacío.
     @classmethod
     def cargar_desde_bd(cls):
-        try:
-            productos = Producto.query.all()
-            productos_dict = {p.id: p for p in productos}
-            return cls(productos_dict)
-        except Exception as e:
-            print(f"Error cargando productos desde la base de datos: {e}")
-            return cls({})
+        inventario = cls()
+        inventario.recargar()
+        return inventario
+
+    # Reemplaza todo el contenido en memoria por lo que hay en la base. El
+    # catálogo nuevo se llena aparte y se publica de una vez: mientras tanto
+    # las lecturas siguen usando el anterior.
+    def recargar(self):
+        # La versión se lee antes que las filas: a lo sumo se reaplica algún cambio
+        version = self._ultimo_cambio()
+        catalogo = self._nuevo_catalogo(self._consultar())
+        with self._lock:
+            self.catalogo = catalogo
+            self.version = version
+            self.en_memoria = True
+            self._superpuestos = {}
+            self._modificaciones += 1
+        return len(catalogo)
+
+    # Id del último cambio de productos del registro (0 si no hay ninguno)
+    @staticmethod
+    def _ultimo_cambio():
+        return (db.session.query(db.func.max(RegistroCambio.id))
+                .filter(RegistroCambio.entidad == 'producto').scalar()) or 0
+
+    # Carga inicial del worker (paso del calentamiento). Sin instantánea, o
+    # si este proceso queda como escritor, se llena el catálogo en memoria.
+    # Los demás no cargan nada: esperan a que la instantánea publicada llegue
+    # a la versión que tenía el registro en el primer intento (el calentamiento
+    # reintenta). El objetivo no se vuelve a leer: con escrituras continuas la
+    # instantánea siempre va un poco por detrás del último cambio.
+    def cargar(self):
+        if self.instantanea is None:
+            return self.recargar()
+        if self.instantanea.intentar_ser_escritor():
+            return self.asumir_escritura()
+        if self._objetivo_carga is None:
+            self._objetivo_carga = self._ultimo_cambio()
+        objetivo = self._objetivo_carga
+        vista = self.instantanea.actual()
+        if vista is None or vista.version < objetivo:
+            raise RuntimeError(f'la instantánea del inventario aún no llega a la versión {objetivo}')
+        self.version = vista.version
+        return len(vista)
+
+    # Este proceso pasa a escribir la instantánea y necesita el catálogo
+    # completo: parte de la última publicada y trae de la base solo lo
+    # modificado desde entonces. Sin instantánea previa, carga completa.
+    def asumir_escritura(self):
+        vista = self.instantanea.actual()
+        if vista is None:
+            return self.recargar()
+        catalogo = self._nuevo_catalogo(vista.registros())
+        with self._lock:
+            self.catalogo = catalogo
+            self.version = vista.version
+            self.en_memoria = True
+            self._superpuestos = {}
+            self._modificaciones += 1
+        self.refrescar_desde()
+        return len(self.catalogo)
+
+    def _nuevo_catalogo(self, registros=()):
+        return CatalogoMemoria(self.ORDENES, self.umbral_stock_bajo, registros)
+
+    # Registros de los productos que cumplen los filtros, leídos por columnas
+    # (sin crear instancias del ORM ni llenar el mapa de identidad)
+    def _consultar(self, *filtros):
+        filas = db.session.query(*RegistroProducto.COLUMNAS).filter(*filtros).all()
+        return [RegistroProducto.desde_modelo(fila) for fila in filas]
+
+    # Registra (o reemplaza) un producto en el catálogo; en un lector de la
+    # instantánea, en los superpuestos
+    def _indexar(self, p):
+        with self._lock:
+            self._modificaciones += 1
+            if self._es_lector():
+                self._superpuestos[p.id] = (p, self._hasta)
+            else:
+                self.catalogo.agregar(p)
+
+    # Quita un producto del catálogo (o lo marca como borrado en los
+    # superpuestos) y devuelve el registro que tenía
+    def _desindexar(self, id):
+        with self._lock:
+            if self._es_lector():
+                p = self.obtener(id)
+                self._superpuestos[id] = (None, self._hasta)
+            else:
+                p = self.catalogo.quitar(id)
+            if p is not None:
+                self._modificaciones += 1
+            return p
+
+    def _es_lector(self):
+        return self.instantanea is not None and not self.en_memoria
+
+    # Tras confirmar una escritura propia se anota el último cambio de
+    # productos del registro, que ya incluye el propio. Con el catálogo en
+    # memoria, la revisión sigue siendo local hasta aplicar un lote que llegue
+    # a esa versión; en un lector, los superpuestos escritos desde ahora se
+    # descartan cuando la instantánea publicada la alcanza.
+    def _tras_confirmar(self):
+        ultimo = self._ultimo_cambio()
+        with self._lock:
+            self._hasta = max(self._hasta, ultimo)
+            self._cambios_locales = True
+
+    # Aplica cambios hechos por otros procesos (ver SincronizadorCambios).
+    # Solo se consultan las filas afectadas, nunca la tabla completa, y la
+    # consulta se hace antes de tomar el lock.
+    def aplicar_cambios(self, cambios):
+        if self._es_lector():
+            # Los lectores no tienen catálogo: leen lo que publique el escritor
+            self.version = max(self.version, max(c.id for c in cambios))
+            return
+        ids, vigentes = set(), {}
+        if any(c.accion == 'reset' for c in cambios):
+            self.recargar()
+        else:
+            ids = {c.entidad_id for c in cambios if c.entidad_id is not None}
+            if ids:
+                vigentes = {p.id: p for p in self._consultar(Producto.id.in_(ids))}
+        with self._lock:
+            for id in ids:
+                self._desindexar(id)
+                if id in vigentes:
+                    self._indexar(vigentes[id])
+            self.version = max(self.version, max(c.id for c in cambios))
+            # Un lote que aún no incluye la escritura propia (p. ej. leído de
+            # una réplica atrasada) no hace la revisión igual a la de otros workers
+            if self.version >= self._hasta:
+                self._cambios_locales = False
+
+    # Trae solo las filas modificadas desde la marca de agua y las bajas
+    # registradas desde entonces (lápidas del registro de cambios).
+    # Sin marca previa equivale a una carga completa. Al terminar, la versión
+    # queda en el último cambio del registro leído antes de las filas.
+    def refrescar_desde(self, marca=None):
+        version = self._ultimo_cambio()
+        total = self._refrescar(marca if marca is not None else self.catalogo.marca)
+        with self._lock:
+            self.version = max(self.version, version)
+        return total
+
+    def _refrescar(self, marca):
+        if marca is None:
+            nuevos = self._consultar()
+            with self._lock:
+                for p in nuevos:
+                    self._indexar(p)
+            return len(nuevos)
+        desde = marca - self.MARGEN_REFRESCO
+        bajas = (RegistroCambio.query
+                 .filter(RegistroCambio.entidad == 'producto',
+                         RegistroCambio.accion.in_(('eliminar', 'reset')),
+                         RegistroCambio.fecha >= desde)
+                 .all())
+        if any(b.accion == 'reset' for b in bajas):
+            self.aplicar_cambios(bajas)
+            return len(self.catalogo)
+        modificados = self._consultar(Producto.fecha_modificacion >= desde)
+        vigentes = {p.id for p in modificados}
+        with self._lock:
+            for b in bajas:
+                if b.entidad_id not in vigentes:
+                    self._desindexar(b.entidad_id)
+            for p in modificados:
+                self._indexar(p)
+        return len(modificados) + len(bajas)
 
     # Crear carpeta de uploads si no existe
     def _ensure_upload_folder(self):
@@ -48,29 +386,14 @@ class Inventario:
             return unique_name
         return None
 
-    # Procesa y optimiza imagen redimensionándola y guardándola
-    def _process_image(self, file_path):
-        try:
-            with Image.open(file_path) as img:
-                if img.mode in ('RGBA', 'LA', 'P'):
-                    img = img.convert('RGB')
-                img.thumbnail(self.IMAGE_SIZE, Image.Resampling.LANCZOS)
-                img.save(file_path, 'JPEG', quality=85, optimize=True)
-            return True
-        except Exception as e:
-            print(f"Error procesando imagen: {e}")
-            if os.path.exists(file_path):
-                os.remove(file_path)
-            return False
-
-    # Guarda archivo de imagen subido, retornando el nombre generado unico
-    def _save_image(self, file):
+    # Valida el archivo subido; devuelve False si no se subió ninguno
+    def _validar_imagen(self, file):
         if file is None:
-            return None
+            return False
         if isinstance(file, str):
-            return None
+            return False
         if not hasattr(file, 'filename') or file.filename == '':
-            return None
+            return False
         if not self._allowed_file(file.filename):
             raise ValueError('Tipo de archivo no permitido. Use: PNG, JPG, JPEG, GIF, WEBP')
         file.seek(0, os.SEEK_END)
@@ -78,32 +401,159 @@ class Inventario:
         file.seek(0)
         if file_size > self.MAX_FILE_SIZE:
             raise ValueError('El archivo es demasiado grande. Máximo 5MB')
+        return True
+
+    # Guarda el archivo sin procesar en la carpeta de pendientes y devuelve
+    # (ruta temporal, carpeta final) para procesar_imagen
+    def _save_pending_image(self, file):
+        if not self._validar_imagen(file):
+            return None
         filename = self._generate_unique_filename(file.filename)
-        if filename:
-            file_path = os.path.join(self.UPLOAD_FOLDER, filename)
-            file.save(file_path)
-            if self._process_image(file_path):
-                return filename
-            else:
-                raise ValueError('Error al procesar la imagen')
-        return None
+        carpeta = os.path.join(self.UPLOAD_FOLDER, 'pendientes')
+        os.makedirs(carpeta, exist_ok=True)
+        ruta_temporal = os.path.join(carpeta, filename)
+        file.save(ruta_temporal)
+        return ruta_temporal, self.UPLOAD_FOLDER
+
+    # Encola la imagen pendiente de un producto ya confirmado en la base de datos
+    def _encolar_imagen(self, producto_id, pendiente):
+        try:
+            self.procesador.enviar(producto_id, *pendiente)
+        except Exception as e:
+            print(f"Error encolando imagen: {e}")
+            if os.path.exists(pendiente[0]):
+                os.remove(pendiente[0])
+
+    # Lo llama el procesador (en un hilo, con contexto de app) cuando la imagen
+    # está lista: la asigna al producto y borra la anterior. Los demás workers
+    # y esta misma caché se enteran por el registro de cambios.
+    def aplicar_imagen_procesada(self, producto_id, filename):
+        usar_principal()
+        p = db.session.get(Producto, producto_id)
+        if not p:
+            return False
+        imagen_anterior = p.imagen
+        p.imagen = filename
+        db.session.commit()
+        self._tras_confirmar()
+        self._asegurar_imagen(filename)
+        if imagen_anterior and imagen_anterior != filename:
+            self._delete_image(imagen_anterior)
+        return True
+
+    # Estado del procesamiento en segundo plano de la imagen de un producto
+    def estado_imagen(self, producto_id):
+        if self.procesador is None:
+            return None
+        return self.procesador.estado.leer(producto_id)
+
+    # Procesa el archivo subido dentro de la petición y retorna el nombre
+    # final, derivado del hash del contenido procesado
+    def _save_image(self, file):
+        pendiente = self._save_pending_image(file)
+        if not pendiente:
+            return None
+        try:
+            return procesar_imagen(pendiente[0], pendiente[1], self.IMAGE_SIZE)
+        except Exception as e:
+            print(f"Error procesando imagen: {e}")
+            raise ValueError('Error al procesar la imagen')
+        finally:
+            if os.path.exists(pendiente[0]):
+                os.remove(pendiente[0])
+
+    # Número de productos que apuntan a un archivo de imagen. Los archivos se
+    # nombran por su contenido y pueden estar compartidos entre productos.
+    # Se cuenta en la base principal: una réplica atrasada podría no ver la
+    # fila que acaba de empezar a usar el archivo.
+    def _referencias_imagen(self, imagen_filename):
+        usar_principal()
+        return Producto.query.filter_by(imagen=imagen_filename).count()
 
-    # Elimina un archivo de imagen del servidor salvo la default
+    # Elimina un archivo de imagen del servidor salvo la default o si algún
+    # producto todavía lo usa; debe llamarse después de confirmar el cambio.
+    # Entre el recuento y el borrado otro proceso puede confirmar un producto
+    # con el mismo archivo (mismo contenido), así que no se borra: se mueve a
+    # la papelera y se vuelve a contar. Si apareció una referencia se restaura;
+    # si la referencia se confirma después de ese segundo recuento, quien la
+    # escribió no encuentra el archivo y lo restaura (_asegurar_imagen).
     def _delete_image(self, imagen_filename):
-        if imagen_filename and imagen_filename != 'default.jpg':
-            file_path = os.path.join(self.UPLOAD_FOLDER, imagen_filename)
-            if os.path.exists(file_path):
-                try:
-                    os.remove(file_path)
-                except Exception as e:
-                    print(f"Error eliminando imagen: {e}")
+        if not imagen_filename or imagen_filename == 'default.jpg':
+            return
+        if self._referencias_imagen(imagen_filename) > 0:
+            return
+        os.makedirs(self.PAPELERA, exist_ok=True)
+        destino = os.path.join(self.PAPELERA, f'{imagen_filename}.{uuid.uuid4().hex}')
+        try:
+            os.replace(os.path.join(self.UPLOAD_FOLDER, imagen_filename), destino)
+        except FileNotFoundError:
+            return
+        except OSError as e:
+            print(f"Error eliminando imagen: {e}")
+            return
+        if self._referencias_imagen(imagen_filename) > 0:
+            self._restaurar_imagen(imagen_filename)
+        self._purgar_papelera()
+
+    # Vuelve a poner en uploads una imagen que está en la papelera. Las copias
+    # tienen el mismo contenido, así que da igual cuál se use.
+    def _restaurar_imagen(self, imagen_filename):
+        try:
+            entradas = os.listdir(self.PAPELERA)
+        except FileNotFoundError:
+            return False
+        for entrada in entradas:
+            if entrada.rsplit('.', 1)[0] != imagen_filename:
+                continue
+            try:
+                os.replace(os.path.join(self.PAPELERA, entrada),
+                           os.path.join(self.UPLOAD_FOLDER, imagen_filename))
+                return True
+            except FileNotFoundError:
+                continue
+        return False
+
+    # Después de confirmar un producto con 'imagen_filename', comprueba que el
+    # archivo siga en uploads y si no lo recupera de la papelera
+    def _asegurar_imagen(self, imagen_filename):
+        if not imagen_filename or imagen_filename == 'default.jpg':
+            return
+        if not os.path.exists(os.path.join(self.UPLOAD_FOLDER, imagen_filename)):
+            self._restaurar_imagen(imagen_filename)
+
+    # Elimina las entradas de la papelera con más de ESPERA_PAPELERA segundos
+    # (como mucho una vez por minuto). Una imagen que se vuelve a subir se
+    # regenera en uploads, así que las entradas viejas ya no hacen falta;
+    # aun así se cuenta antes por si alguna quedó referenciada.
+    def _purgar_papelera(self):
+        ahora = time.time()
+        if ahora - self._ultima_purga < 60:
+            return
+        self._ultima_purga = ahora
+        for entrada in os.listdir(self.PAPELERA):
+            ruta = os.path.join(self.PAPELERA, entrada)
+            try:
+                if ahora - os.path.getmtime(ruta) < self.ESPERA_PAPELERA:
+                    continue
+                imagen_filename = entrada.rsplit('.', 1)[0]
+                if (self._referencias_imagen(imagen_filename) > 0 and not
+                        os.path.exists(os.path.join(self.UPLOAD_FOLDER, imagen_filename))):
+                    os.replace(ruta, os.path.join(self.UPLOAD_FOLDER, imagen_filename))
+                else:
+                    os.remove(ruta)
+            except OSError as e:
+                print(f"Error purgando la papelera de imágenes: {e}")
 
     # Agrega un producto nuevo al inventario y base de datos
-    def agregar(self, nombre: str, cantidad: int, precio: float, imagen_file=None) -> Producto:
-        if nombre.lower() in self.nombres:
+    def agregar(self, nombre: str, cantidad: int, precio: float, imagen_file=None) -> RegistroProducto:
+        if self._existe_nombre(nombre.lower()):
             raise ValueError('Ya existe un producto con ese nombre.')
         imagen_filename = None
-        if imagen_file:
+        pendiente = None
+        if imagen_file and self.procesador is not None:
+            # Se guarda con la imagen por defecto y se reemplaza al terminar el proceso
+            pendiente = self._save_pending_image(imagen_file)
+        elif imagen_file:
             imagen_filename = self._save_image(imagen_file)
         p = Producto(
             nombre=nombre.strip(),
@@ -114,44 +564,56 @@ class Inventario:
         try:
             db.session.add(p)
             db.session.commit()
-            self.productos[p.id] = p
-            self.nombres.add(p.nombre.lower())
-            return p
+            self._tras_confirmar()
+            self._asegurar_imagen(imagen_filename)
+            registro = RegistroProducto.desde_modelo(p)
+            self._indexar(registro)
+            if pendiente:
+                self._encolar_imagen(p.id, pendiente)
+            return registro
         except Exception as e:
             if imagen_filename:
                 self._delete_image(imagen_filename)
+            if pendiente and os.path.exists(pendiente[0]):
+                os.remove(pendiente[0])
             raise e
 
     # Elimina producto por id, eliminando imagen si aplica
     def eliminar(self, id: int) -> bool:
-        p = self.productos.get(id) or Producto.query.get(id)
+        usar_principal()
+        p = db.session.get(Producto, id)
         if not p:
             return False
-        self._delete_image(p.imagen)
+        imagen = p.imagen
         db.session.delete(p)
         db.session.commit()
-        self.productos.pop(id, None)
-        self.nombres.discard(p.nombre.lower())
+        self._tras_confirmar()
+        self._desindexar(id)
+        self._delete_image(imagen)
         return True
 
     # Actualiza producto por id con nuevos valores y bytes de imagen
-    def actualizar(self, id: int, nombre=None, cantidad=None, precio=None, imagen_file=None) -> Producto | None:
-        p = self.productos.get(id) or Producto.query.get(id)
+    def actualizar(self, id: int, nombre=None, cantidad=None, precio=None, imagen_file=None) -> RegistroProducto | None:
+        usar_principal()
+        p = db.session.get(Producto, id)
         if not p:
             return None
         if nombre is not None:
             nuevo = nombre.strip()
-            if nuevo.lower() != p.nombre.lower() and nuevo.lower() in self.nombres:
+            if nuevo.lower() != p.nombre.lower() and self._existe_nombre(nuevo.lower()):
                 raise ValueError('Ya existe otro producto con ese nombre.')
         nueva_imagen = None
+        pendiente = None
         imagen_anterior = p.imagen
-        if imagen_file:
+        if imagen_file and self.procesador is not None:
+            # Se conserva la imagen actual hasta que la nueva esté procesada
+            pendiente = self._save_pending_image(imagen_file)
+        elif imagen_file:
             nueva_imagen = self._save_image(imagen_file)
+        anterior = self._desindexar(p.id)
         try:
             if nombre is not None:
-                self.nombres.discard(p.nombre.lower())
                 p.nombre = nombre.strip()
-                self.nombres.add(p.nombre.lower())
             if cantidad is not None:
                 p.cantidad = int(cantidad)
             if precio is not None:
@@ -159,30 +621,367 @@ class Inventario:
             if nueva_imagen:
                 p.imagen = nueva_imagen
             db.session.commit()
-            if nueva_imagen and imagen_anterior != 'default.jpg':
+            self._tras_confirmar()
+            if nueva_imagen and nueva_imagen != imagen_anterior:
+                self._asegurar_imagen(nueva_imagen)
                 self._delete_image(imagen_anterior)
-            self.productos[p.id] = p
-            return p
+            registro = RegistroProducto.desde_modelo(p)
+            self._indexar(registro)
+            if pendiente:
+                self._encolar_imagen(p.id, pendiente)
+            return registro
         except Exception as e:
-            if nueva_imagen:
+            db.session.rollback()
+            if anterior is not None:
+                self._indexar(anterior)
+            if nueva_imagen and nueva_imagen != imagen_anterior:
                 self._delete_image(nueva_imagen)
+            if pendiente and os.path.exists(pendiente[0]):
+                os.remove(pendiente[0])
             raise e
 
-    # Busca productos que contengan texto q en el nombre (en minúsculas)
-    def buscar_por_nombre(self, q: str):
-        q = q.lower()
-        return sorted(
-            [p for p in self.productos.values() if q in p.nombre.lower()],
-            key=lambda x: x.nombre
-        )
+    # Suma 'delta' (negativo para descontar) al stock de varios productos en una
+    # sola transacción. Cada línea (id, delta) es un UPDATE condicional
+    # (cantidad = cantidad + delta WHERE cantidad >= -delta): la base resuelve
+    # las ventas concurrentes sin perder ninguna y no se reescribe el resto del
+    # producto. Con todo_o_nada (un pedido) una línea fallida deshace todas;
+    # si no, se confirman las que tengan stock.
+    def ajustar_stock(self, lineas, todo_o_nada=True) -> AjusteStock:
+        usar_principal()
+        lineas = [(int(id), int(delta)) for id, delta in lineas]
+        tabla = Producto.__table__
+        fallidas = []
+        try:
+            # En orden de id para que dos pedidos simultáneos no se bloqueen entre sí
+            for i in sorted(range(len(lineas)), key=lambda i: lineas[i][0]):
+                id, delta = lineas[i]
+                resultado = db.session.execute(
+                    tabla.update()
+                    .where(tabla.c.id == id, tabla.c.cantidad >= -delta)
+                    .values(cantidad=tabla.c.cantidad + delta)
+                )
+                if resultado.rowcount == 0:
+                    fallidas.append(i)
+            if fallidas:
+                ids = {lineas[i][0] for i in fallidas}
+                existentes = {id for (id,) in db.session.query(Producto.id).filter(Producto.id.in_(ids))}
+                fallidas = [{'linea': i, 'id': lineas[i][0],
+                             'motivo': 'sin_stock' if lineas[i][0] in existentes else 'no_existe'}
+                            for i in sorted(fallidas)]
+                if todo_o_nada:
+                    db.session.rollback()
+                    return AjusteStock({}, fallidas)
+            rechazadas = {f['linea'] for f in fallidas}
+            ids = {id for i, (id, _) in enumerate(lineas) if i not in rechazadas}
+            if not ids:
+                db.session.rollback()
+                return AjusteStock({}, fallidas)
+            # Un UPDATE del Core no pasa por los eventos del ORM: se anota a mano
+            conexion = db.session.connection()
+            for id in sorted(ids):
+                RegistroCambio.registrar(conexion, 'producto', id, 'guardar')
+            # Dentro de la transacción las filas siguen bloqueadas: son nuestros valores
+            filas = (db.session.query(Producto.id, Producto.cantidad, Producto.fecha_modificacion)
+                     .filter(Producto.id.in_(ids)).all())
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        self._tras_confirmar()
+        with self._lock:
+            for id, cantidad, fecha_modificacion in filas:
+                p = self._desindexar(id)
+                if p is not None:
+                    self._indexar(p._replace(cantidad=cantidad, fecha_modificacion=fecha_modificacion))
+        return AjusteStock({id: cantidad for id, cantidad, _ in filas}, fallidas)
+
+    # Fuente de las lecturas y superpuestos vigentes ({id: registro o None}).
+    # Con el catálogo en memoria no hay superpuestos; en un lector se
+    # descartan los que la instantánea publicada ya incluye.
+    def _lectura(self):
+        if not self._es_lector():
+            return self.catalogo, {}
+        vista = self.instantanea.actual()
+        with self._lock:
+            if self._superpuestos:
+                self._superpuestos = {id: (p, hasta) for id, (p, hasta) in self._superpuestos.items()
+                                      if hasta > vista.version}
+            return vista, {id: p for id, (p, _) in self._superpuestos.items()}
+
+    # El catálogo en memoria se lee bajo el lock; la instantánea es inmutable
+    def _bloqueo(self, fuente):
+        return self._lock if isinstance(fuente, CatalogoMemoria) else nullcontext()
+
+    @staticmethod
+    def _leer(fuente, superpuestos, id):
+        return superpuestos[id] if id in superpuestos else fuente.obtener(id)
+
+    # El registro cumple la consulta (ya normalizada) y los rangos
+    @staticmethod
+    def _cumple(p, consulta, rangos):
+        if consulta is not None and consulta not in normalizar(p.nombre):
+            return False
+        for campo, (minimo, maximo) in rangos.items():
+            valor = getattr(p, campo)
+            if (minimo is not None and valor < minimo) or (maximo is not None and valor > maximo):
+                return False
+        return True
+
+    # Claves que los superpuestos quitan de la secuencia de la fuente (las de
+    # la versión publicada, si cumplía el filtro) y las que agregan (las del
+    # registro propio, si lo cumple). Sin criterio de orden, de relevancia.
+    # 'consulta' ya viene normalizada (ver _consulta).
+    def _ajustes(self, fuente, superpuestos, consulta, orden, rangos):
+        quitar, agregar = set(), []
+        for id, nuevo in superpuestos.items():
+            anterior = fuente.obtener(id)
+            for p, destino in ((anterior, quitar.add), (nuevo, agregar.append)):
+                if p is not None and self._cumple(p, consulta, rangos):
+                    destino(self.ORDENES[orden](p) if orden is not None
+                            else clave_relevancia(normalizar(p.nombre), consulta, p.id))
+        return quitar, sorted(agregar)
+
+    # Lista corta con las claves de la fuente alrededor del cursor (sin las
+    # quitadas) más las agregadas. Se toman suficientes a cada lado para
+    # llenar una página aunque falten todas las quitadas, así que paginar
+    # sobre ella da la misma página que sobre la secuencia combinada.
+    @staticmethod
+    def _ventana(claves, quitar, agregar, limit, cursor, desc):
+        margen = limit + len(quitar) + 1
+        if cursor is not None:
+            posicion = bisect_left(claves, cursor)
+        else:
+            posicion = len(claves) if desc else 0
+        cercanas = claves[max(0, posicion - margen):posicion + margen]
+        return sorted([clave for clave in cercanas if clave not in quitar] + agregar)
+
+    # Hay otro producto con ese nombre (en minúsculas)
+    def _existe_nombre(self, nombre_lower):
+        fuente, superpuestos = self._lectura()
+        if any(p is not None and p.nombre_lower == nombre_lower for p in superpuestos.values()):
+            return True
+        with self._bloqueo(fuente):
+            id = fuente.id_por_nombre(nombre_lower)
+        return id is not None and id not in superpuestos
+
+    # Busca productos que contengan texto q en el nombre, sin distinguir
+    # mayúsculas ni tildes. Por defecto ordena por relevancia; con un criterio
+    # de ORDENES solo se ordenan las coincidencias usando las claves del índice
+    def buscar_por_nombre(self, q: str, orden=None, desc=False):
+        if self._consulta(q) is None:
+            return []
+        return list(self.iterar(q=q, orden=orden, desc=desc))
+
+    # Retorna lista de todos los productos en el orden pedido (nombre por
+    # defecto) recorriendo el índice ya ordenado, sin ordenar en cada petición
+    def listar_todos(self, orden='nombre', desc=False):
+        return list(self.iterar(orden=orden, desc=desc))
+
+    # Recorre productos (todos o los que coinciden con q y los rangos) en el
+    # orden pedido sin construir la lista de objetos; pensado para respuestas
+    # en streaming. Del catálogo en memoria se copian las claves para tolerar
+    # cambios durante el recorrido; los superpuestos se intercalan en orden.
+    def iterar(self, q=None, orden=None, desc=False, rangos=None):
+        q = self._consulta(q)
+        rangos = self._rangos_activos(rangos)
+        if not q:
+            orden = orden or 'nombre'
+        desc = desc and orden is not None
+        fuente, superpuestos = self._lectura()
+        with self._bloqueo(fuente):
+            claves = self._claves(fuente, q, orden, rangos)
+            if isinstance(fuente, CatalogoMemoria):
+                claves = list(claves)
+        if superpuestos:
+            quitar, agregar = self._ajustes(fuente, superpuestos, q, orden, rangos)
+            base = (clave for clave in (reversed(claves) if desc else claves) if clave not in quitar)
+            claves = heapq.merge(base, reversed(agregar) if desc else agregar, reverse=desc)
+        elif desc:
+            claves = reversed(claves)
+        for clave in claves:
+            p = self._leer(fuente, superpuestos, clave[-1])
+            if p is not None:
+                yield p
+
+    # Número de productos que devolvería iterar(q, rangos=rangos)
+    def contar(self, q=None, rangos=None):
+        q = self._consulta(q)
+        rangos = self._rangos_activos(rangos)
+        fuente, superpuestos = self._lectura()
+        with self._bloqueo(fuente):
+            ids = self._ids_en_rangos(fuente, rangos)
+            if q:
+                candidatos = fuente.candidatos(q)
+                total = len(candidatos) if ids is None else sum(1 for id in candidatos if id in ids)
+            else:
+                total = len(fuente) if ids is None else len(ids)
+        for id, nuevo in superpuestos.items():
+            anterior = fuente.obtener(id)
+            total -= anterior is not None and self._cumple(anterior, q, rangos)
+            total += nuevo is not None and self._cumple(nuevo, q, rangos)
+        return total
+
+    # Consulta normalizada una sola vez, o None si no queda nada que buscar
+    # (p. ej. solo espacios o una tilde suelta, que normalizar elimina)
+    @staticmethod
+    def _consulta(q):
+        return normalizar(q).strip() or None
+
+    # Rangos con al menos un extremo: {'precio': (min, max), ...}
+    def _rangos_activos(self, rangos):
+        return {campo: rango for campo, rango in (rangos or {}).items()
+                if campo in self.RANGOS and rango != (None, None)}
+
+    # Ids que cumplen todos los rangos (None si no hay ninguno). Cada rango es
+    # un corte del índice ordenado; se intersecta empezando por el más chico.
+    def _ids_en_rangos(self, fuente, rangos):
+        if not rangos:
+            return None
+        cortes = sorted((fuente.rango(campo, *rango) for campo, rango in rangos.items()), key=len)
+        ids = {clave[-1] for clave in cortes[0]}
+        for claves in cortes[1:]:
+            if not ids:
+                break
+            ids.intersection_update(clave[-1] for clave in claves)
+        return ids
+
+    # Claves ordenadas (ascendentes) de los productos que cumplen q (ya
+    # normalizada) y los rangos. Sin criterio de orden, las de relevancia.
+    def _claves(self, fuente, q, orden, rangos):
+        if not q and not rangos:
+            return fuente.claves(orden)
+        if not q and list(rangos) == [orden]:
+            # El único rango es sobre el mismo criterio de orden: ya viene ordenado
+            return fuente.rango(orden, *rangos[orden])
+        ids = self._ids_en_rangos(fuente, rangos)
+        if q and orden is None:
+            claves = fuente.buscar_claves(q)
+            return claves if ids is None else [clave for clave in claves if clave[-1] in ids]
+        if q:
+            candidatos = fuente.candidatos(q)
+            ids = candidatos if ids is None else [id for id in candidatos if id in ids]
+        return sorted(fuente.clave(orden, id) for id in ids)
+
+    # Producto por id
+    def obtener(self, id):
+        fuente, superpuestos = self._lectura()
+        return self._leer(fuente, superpuestos, id)
+
+    # Resumen de estadísticas: el del catálogo en memoria o, en un lector, el
+    # que el escritor guardó en la instantánea (sin las escrituras propias
+    # que aún no se publicaron)
+    def resumen_estadisticas(self):
+        fuente, _ = self._lectura()
+        if isinstance(fuente, CatalogoMemoria):
+            return fuente.estadisticas.resumen()
+        return dict(fuente.estadisticas)
+
+    # Identifica el contenido de la caché para las ETags. Es la versión del
+    # registro de cambios (en un lector, la de la instantánea que lee), igual
+    # en todos los workers al día; con escrituras propias que aún no se ven
+    # en ella se añade el contador local de este proceso.
+    def revision(self):
+        if self._es_lector():
+            vista, superpuestos = self._lectura()
+            if superpuestos:
+                return f'{vista.version}-{os.getpid()}-{self._modificaciones}'
+            return str(vista.version)
+        if self._cambios_locales:
+            return f'{self.version}-{os.getpid()}-{self._modificaciones}'
+        return str(self.version)
+
+    # Escribe la instantánea con el contenido actual si cambió desde la
+    # última publicación (solo el proceso escritor). Un proceso que acaba de
+    # obtener el papel carga antes el catálogo completo.
+    def publicar_instantanea(self):
+        if self.instantanea is None or not self.instantanea.intentar_ser_escritor():
+            return False
+        if not self.en_memoria:
+            self.asumir_escritura()
+        with self._lock:
+            estado = (self.version, self._modificaciones)
+            if estado == self._publicado:
+                return False
+            registros = self.catalogo.registros()
+            estadisticas = self.catalogo.estadisticas.resumen()
+        self.instantanea.publicar(registros, estado[0], estadisticas)
+        self._publicado = estado
+        return True
+
+    # Codifica la clave del último elemento de una página como cursor opaco
+    @staticmethod
+    def _codificar_cursor(clave):
+        valores = [v.isoformat() if isinstance(v, datetime) else v for v in clave]
+        texto = json.dumps(valores, ensure_ascii=False, separators=(',', ':'))
+        return base64.urlsafe_b64encode(texto.encode('utf-8')).decode('ascii').rstrip('=')
+
+    # Tipos de cada componente de las claves de cada criterio de orden (None:
+    # relevancia). Un cursor que no encaja no se puede comparar con las claves.
+    TIPOS_CURSOR = {
+        None: (int, int, int, str, int),
+        'nombre': (str, int),
+        'precio': ((int, float), int),
+        'cantidad': (int, int),
+        'fecha_creacion': (str, int),
+    }
+
+    # Decodifica un cursor; devuelve None si es inválido o de otro criterio de orden
+    @classmethod
+    def _decodificar_cursor(cls, cursor, orden):
+        if not cursor:
+            return None
+        try:
+            relleno = '=' * (-len(cursor) % 4)
+            valores = json.loads(base64.urlsafe_b64decode(cursor + relleno).decode('utf-8'))
+            tipos = cls.TIPOS_CURSOR[orden]
+            if not isinstance(valores, list) or len(valores) != len(tipos):
+                return None
+            if any(isinstance(v, bool) or not isinstance(v, t) for v, t in zip(valores, tipos)):
+                return None
+            if orden == 'fecha_creacion':
+                valores[0] = datetime.fromisoformat(valores[0])
+            return tuple(valores)
+        except (ValueError, TypeError, KeyError, IndexError):
+            return None
 
-    # Retorna lista de todos los productos ordenados por nombre
-    def listar_todos(self):
-        return sorted(self.productos.values(), key=lambda x: x.nombre)
+    # Listado o búsqueda paginados por cursor (keyset): 'after' y 'before' son
+    # los cursores devueltos en una Pagina anterior. El coste no depende de
+    # cuántas páginas se hayan recorrido ni del tamaño del catálogo.
+    # Sin criterio de orden, las búsquedas van por relevancia y los listados por nombre.
+    # 'rangos' filtra por precio y cantidad: {'precio': (min, max), ...}.
+    def listar_pagina(self, limit=None, after=None, before=None, q=None, orden=None, desc=False,
+                      rangos=None) -> Pagina:
+        limit = max(1, min(int(limit or self.LIMITE_PAGINA), self.LIMITE_PAGINA_MAXIMO))
+        q = self._consulta(q)
+        rangos = self._rangos_activos(rangos)
+        if not q:
+            orden = orden or 'nombre'
+        cursor_despues = self._decodificar_cursor(after, orden)
+        cursor_antes = self._decodificar_cursor(before, orden)
+        desc = desc and orden is not None
+        fuente, superpuestos = self._lectura()
+        with self._bloqueo(fuente):
+            claves = self._claves(fuente, q, orden, rangos)
+            total = len(claves)
+            if superpuestos:
+                quitar, agregar = self._ajustes(fuente, superpuestos, q, orden, rangos)
+                total += len(agregar) - len(quitar)
+                cursor = cursor_antes if cursor_antes is not None else cursor_despues
+                claves = self._ventana(claves, quitar, agregar, limit, cursor, desc)
+            pagina, hay_anterior, hay_siguiente = paginar(
+                claves, limit, despues=cursor_despues, antes=cursor_antes, desc=desc
+            )
+            productos = [self._leer(fuente, superpuestos, clave[-1]) for clave in pagina]
+        anterior = self._codificar_cursor(pagina[0]) if pagina and hay_anterior else None
+        if not pagina and after and cursor_despues is not None:
+            # Se pasó del final (p. ej. se borró el último producto): volver atrás
+            anterior = after
+        siguiente = self._codificar_cursor(pagina[-1]) if pagina and hay_siguiente else None
+        return Pagina(productos, anterior, siguiente, total)
 
     # Ruta absoluta de imagen del producto
     def get_product_image_path(self, product_id: int):
-        p = self.productos.get(product_id)
+        p = self.obtener(product_id)
         if p and p.imagen:
             return os.path.join(self.UPLOAD_FOLDER, p.imagen)
         return None
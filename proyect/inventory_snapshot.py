@@ -0,0 +1,363 @@
+from inventory import RegistroProducto, Inventario
+from search_index import normalizar, clave_relevancia
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+import threading
+import time
+import uuid
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Formato de la instantánea (little-endian):
+#   cabecera     magia, número de registros, versión y offset de cada sección
+#   registros    uno de tamaño fijo por producto, ordenados por id
+#   ids          int64 por registro (para buscar por id con bisección)
+#   órdenes      uint32 por registro y criterio de ORDENES: índices de
+#                registro ordenados por la clave de ese criterio
+#   offsets      uint32 por registro: inicio de su nombre en 'normalizados'
+#   cadenas      nombres e imágenes en UTF-8 (los registros guardan offset y largo)
+#   normalizados nombres normalizados separados por \0, para buscar subcadenas
+#   estadísticas resumen de EstadisticasInventario en JSON
+MAGIA = b'INV2'
+# Criterios de orden guardados, con las mismas claves que Inventario.ORDENES
+ORDENES = tuple(Inventario.ORDENES)
+SECCIONES = 6 + len(ORDENES)
+CABECERA = struct.Struct(f'<4sIQ{SECCIONES}Q')
+# id, cantidad, precio, fecha_creacion y fecha_modificacion (µs desde 1970),
+# offset y largo del nombre, offset y largo de la imagen
+REGISTRO = struct.Struct('<qqdqqIIII')
+EPOCA = datetime(1970, 1, 1)
+SIN_FECHA = -2 ** 63
+
+def _a_us(fecha):
+    return SIN_FECHA if fecha is None else (fecha - EPOCA) // timedelta(microseconds=1)
+
+def _de_us(valor):
+    return None if valor == SIN_FECHA else EPOCA + timedelta(microseconds=valor)
+
+def _alinear(datos):
+    datos += b'\0' * (-len(datos) % 8)
+    return datos
+
+# Escribe la instantánea de 'productos' en un archivo nuevo. Nunca se
+# sobrescribe uno existente: puede estar mapeado por otro proceso.
+def escribir_instantanea(ruta, productos, version, estadisticas=None):
+    productos = sorted(productos, key=lambda p: p.id)
+    registros = bytearray()
+    cadenas = bytearray()
+    normalizados = bytearray()
+    ids = array('q')
+    offsets = array('I')
+    for p in productos:
+        nombre = p.nombre.encode('utf-8')
+        imagen = (p.imagen or '').encode('utf-8')
+        registros += REGISTRO.pack(
+            p.id, p.cantidad, float(p.precio),
+            _a_us(p.fecha_creacion), _a_us(p.fecha_modificacion),
+            len(cadenas), len(nombre), len(cadenas) + len(nombre), len(imagen)
+        )
+        cadenas += nombre + imagen
+        ids.append(p.id)
+        offsets.append(len(normalizados))
+        normalizados += normalizar(p.nombre).encode('utf-8') + b'\0'
+    ordenes = []
+    for orden in ORDENES:
+        clave = Inventario.ORDENES[orden]
+        ordenes.append(array('I', sorted(range(len(productos)), key=lambda i: clave(productos[i]))))
+    if sys.byteorder != 'little':
+        for arr in [ids, offsets] + ordenes:
+            arr.byteswap()
+
+    secciones = ([registros, ids.tobytes()] + [arr.tobytes() for arr in ordenes]
+                 + [offsets.tobytes(), cadenas, normalizados,
+                    json.dumps(estadisticas or {}).encode('utf-8')])
+    inicio = CABECERA.size + (-CABECERA.size % 8)
+    posiciones = []
+    for seccion in secciones:
+        posiciones.append(inicio)
+        inicio += len(seccion) + (-len(seccion) % 8)
+
+    with open(ruta, 'xb') as f:
+        f.write(_alinear(bytearray(CABECERA.pack(MAGIA, len(productos), version, *posiciones))))
+        for seccion in secciones:
+            f.write(_alinear(bytearray(seccion)))
+        f.flush()
+        os.fsync(f.fileno())
+
+# Claves de un criterio de orden de la instantánea entre las posiciones
+# 'inicio' y 'fin' de su permutación. Se comporta como la lista de claves de
+# IndiceOrdenado para len, índices y cortes (lo que usan bisect y paginar),
+# pero cada clave se decodifica del mapa solo cuando se pide.
+class ClavesInstantanea:
+
+    def __init__(self, vista, orden, inicio=0, fin=None):
+        self.vista = vista
+        self.orden = orden
+        self.inicio = inicio
+        self.fin = len(vista) if fin is None else fin
+
+    def __len__(self):
+        return self.fin - self.inicio
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return self.vista.clave_en(self.orden, self.inicio + i)
+
+    # Subsecuencia perezosa entre dos posiciones (relativas a esta)
+    def corte(self, inicio, fin):
+        return ClavesInstantanea(self.vista, self.orden, self.inicio + inicio, self.inicio + fin)
+
+# Una instantánea mapeada en memoria. Es inmutable: cuando se publica una
+# nueva se crea otra vista y esta sigue siendo válida mientras se use.
+# Ofrece las mismas lecturas que CatalogoMemoria (obtener, claves, rango,
+# clave, candidatos, buscar_claves...), resueltas sobre el mapa.
+class VistaInstantanea:
+
+    def __init__(self, ruta):
+        if sys.byteorder != 'little':
+            raise RuntimeError('La instantánea del inventario requiere una máquina little-endian')
+        self.nombre = os.path.basename(ruta)
+        with open(ruta, 'rb') as f:
+            self._mapa = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magia, self.total, self.version, *pos = CABECERA.unpack_from(self._mapa, 0)
+        if magia != MAGIA:
+            raise ValueError(f'{ruta} no es una instantánea de inventario')
+        vista = memoryview(self._mapa)
+        n = self.total
+        self._registros = pos[0]
+        self._ids = vista[pos[1]:pos[1] + 8 * n].cast('q')
+        self._ordenes = {orden: vista[inicio:inicio + 4 * n].cast('I')
+                         for orden, inicio in zip(ORDENES, pos[2:])}
+        resto = pos[2 + len(ORDENES):]
+        self._offsets = vista[resto[0]:resto[0] + 4 * n].cast('I')
+        self._cadenas = resto[1]
+        self._normalizados = resto[2]
+        self._fin_normalizados = resto[3]
+        self.estadisticas = json.loads(bytes(self._mapa[resto[3]:]).rstrip(b'\0') or b'{}')
+
+    def __len__(self):
+        return self.total
+
+    def _cadena(self, offset, largo):
+        inicio = self._cadenas + offset
+        return self._mapa[inicio:inicio + largo].decode('utf-8')
+
+    def _normalizado(self, i):
+        inicio = self._normalizados + self._offsets[i]
+        return self._mapa[inicio:self._mapa.find(b'\0', inicio)].decode('utf-8')
+
+    def registro(self, i):
+        (id, cantidad, precio, creado, modificado,
+         n_off, n_len, i_off, i_len) = REGISTRO.unpack_from(self._mapa, self._registros + i * REGISTRO.size)
+        nombre = self._cadena(n_off, n_len)
+        return RegistroProducto(
+            id, nombre, nombre.lower(), cantidad, precio,
+            self._cadena(i_off, i_len) or None, _de_us(creado), _de_us(modificado)
+        )
+
+    def _indice(self, id):
+        i = bisect_left(self._ids, id)
+        if i < self.total and self._ids[i] == id:
+            return i
+        return None
+
+    def obtener(self, id):
+        i = self._indice(id)
+        return None if i is None else self.registro(i)
+
+    def registros(self):
+        return [self.registro(i) for i in range(self.total)]
+
+    # Clave del registro que ocupa la posición 'posicion' del criterio 'orden'
+    def clave_en(self, orden, posicion):
+        return Inventario.ORDENES[orden](self.registro(self._ordenes[orden][posicion]))
+
+    def clave(self, orden, id):
+        return Inventario.ORDENES[orden](self.obtener(id))
+
+    def claves(self, orden):
+        return ClavesInstantanea(self, orden)
+
+    # Claves cuyo valor está entre minimo y maximo (incluidos): dos
+    # bisecciones sobre la permutación y un corte perezoso
+    def rango(self, orden, minimo=None, maximo=None):
+        claves = self.claves(orden)
+        inicio = 0 if minimo is None else bisect_left(claves, (minimo,))
+        fin = len(claves) if maximo is None else bisect_right(claves, (maximo, float('inf')))
+        return claves.corte(inicio, max(inicio, fin))
+
+    # Id del producto con ese nombre en minúsculas, o None
+    def id_por_nombre(self, nombre_lower):
+        claves = self.claves('nombre')
+        i = bisect_left(claves, (nombre_lower,))
+        if i < len(claves):
+            clave = claves[i]
+            if clave[0] == nombre_lower:
+                return clave[-1]
+        return None
+
+    # Índices de registro cuyo nombre normalizado contiene la consulta, con
+    # mmap.find sobre la sección de nombres (sin crear objetos por producto)
+    def _coincidencias(self, aguja):
+        if not aguja:
+            # find de b'' siempre encuentra algo en la posición de inicio
+            return
+        fin = self._fin_normalizados
+        pos = self._mapa.find(aguja, self._normalizados, fin)
+        while pos != -1:
+            i = bisect_right(self._offsets, pos - self._normalizados) - 1
+            yield i
+            # Se salta al nombre siguiente para no contar dos veces el mismo
+            siguiente = self._normalizados + self._offsets[i + 1] if i + 1 < self.total else fin
+            pos = self._mapa.find(aguja, siguiente, fin)
+
+    # Ids cuyo nombre normalizado contiene la consulta (ya normalizada)
+    def candidatos(self, consulta):
+        return [self._ids[i] for i in self._coincidencias(consulta.encode('utf-8'))]
+
+    # Mismas claves de relevancia que IndiceTrigramas.buscar_claves
+    def buscar_claves(self, q):
+        consulta = normalizar(q).strip()
+        if not consulta:
+            return []
+        return sorted(
+            clave_relevancia(self._normalizado(i), consulta, self._ids[i])
+            for i in self._coincidencias(consulta.encode('utf-8'))
+        )
+
+# Acceso a la instantánea publicada en 'ruta'. Todos los procesos la leen;
+# solo el que consigue el bloqueo del archivo .lock la escribe. Si ese
+# proceso termina, el bloqueo se libera y otro toma el relevo.
+# Cada publicación es un archivo nuevo '<ruta>.<versión>-<sufijo>' y 'ruta'
+# es un puntero de texto con el nombre del vigente. Un archivo mapeado no se
+# reemplaza ni se borra mientras se usa (Windows no lo permite): los
+# anteriores se borran después y, si alguno sigue abierto, en la siguiente.
+class InstantaneaInventario:
+
+    # Publicaciones anteriores a la vigente que se conservan, para que un
+    # lector que acaba de leer el puntero todavía encuentre el archivo
+    CONSERVAR = 1
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self.carpeta = os.path.dirname(ruta) or '.'
+        self._prefijo = os.path.basename(ruta) + '.'
+        self._patron = re.compile(re.escape(self._prefijo) + r'\d+-[0-9a-f]{8}$')
+        self._vista = None
+        self._bloqueo = None
+        self._pid = None
+        self._lock = threading.Lock()
+        os.makedirs(self.carpeta, exist_ok=True)
+
+    # Nombre del archivo vigente según el puntero (None si no hay o no se pudo leer)
+    def _leer_puntero(self):
+        try:
+            with open(self.ruta, 'rb') as f:
+                nombre = f.read(256).decode('ascii').strip()
+        except (OSError, UnicodeDecodeError):
+            return None
+        return nombre if self._patron.match(nombre) else None
+
+    # Vista de la última instantánea publicada, o None si aún no hay ninguna.
+    # Si el puntero no se puede leer en este momento se sigue con la vista que
+    # ya estaba abierta.
+    def actual(self):
+        for _ in range(2):
+            nombre = self._leer_puntero()
+            vista = self._vista
+            if nombre is None or (vista is not None and vista.nombre == nombre):
+                return vista
+            with self._lock:
+                if self._vista is not None and self._vista.nombre == nombre:
+                    return self._vista
+                try:
+                    self._vista = VistaInstantanea(os.path.join(self.carpeta, nombre))
+                    return self._vista
+                except FileNotFoundError:
+                    # Se publicó otra y esta ya se borró: se vuelve a leer el puntero
+                    continue
+                except (OSError, ValueError, struct.error) as e:
+                    print(f"Error abriendo la instantánea del inventario: {e}")
+                    return vista
+        return self._vista
+
+    # Un proceso hijo creado con fork hereda el descriptor, pero no el papel
+    @property
+    def es_escritor(self):
+        return self._bloqueo is not None and self._pid == os.getpid()
+
+    # Intenta (sin esperar) convertirse en el proceso que escribe
+    def intentar_ser_escritor(self):
+        if self.es_escritor:
+            return True
+        f = open(self.ruta + '.lock', 'a+')
+        try:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            f.close()
+            return False
+        self._bloqueo = f
+        self._pid = os.getpid()
+        return True
+
+    # Escribe la instantánea en un archivo nuevo, apunta el puntero a él y
+    # borra las publicaciones viejas que ya no estén abiertas
+    def publicar(self, productos, version, estadisticas=None):
+        if not self.es_escritor:
+            raise RuntimeError('Solo el proceso escritor publica la instantánea')
+        nombre = f'{self._prefijo}{version}-{uuid.uuid4().hex[:8]}'
+        escribir_instantanea(os.path.join(self.carpeta, nombre), productos, version, estadisticas)
+        temporal = f'{self.ruta}.{uuid.uuid4().hex}.tmp'
+        with open(temporal, 'w', encoding='ascii') as f:
+            f.write(nombre)
+            f.flush()
+            os.fsync(f.fileno())
+        # En Windows el reemplazo falla si un lector tiene el puntero abierto
+        # justo en ese momento; basta con reintentar
+        for intento in range(10):
+            try:
+                os.replace(temporal, self.ruta)
+                break
+            except PermissionError:
+                if intento == 9:
+                    os.remove(temporal)
+                    os.remove(os.path.join(self.carpeta, nombre))
+                    raise
+                time.sleep(0.01)
+        self._borrar_anteriores(nombre)
+
+    def _borrar_anteriores(self, vigente):
+        anteriores = []
+        for entrada in os.scandir(self.carpeta):
+            if entrada.name != vigente and self._patron.match(entrada.name):
+                try:
+                    anteriores.append((entrada.stat().st_mtime_ns, entrada.path))
+                except FileNotFoundError:
+                    pass
+        anteriores.sort(reverse=True)
+        for _, ruta in anteriores[self.CONSERVAR:]:
+            try:
+                os.remove(ruta)
+            except OSError:
+                # Todavía mapeado por algún proceso (Windows): en la próxima
+                pass
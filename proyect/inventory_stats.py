@@ -0,0 +1,112 @@
+from models import db, Producto
+from sqlalchemy import case
+from decimal import Decimal
+import heapq
+import threading
+
+# Estadísticas del inventario mantenidas de forma incremental: cada alta,
+# cambio o baja que pasa por Inventario las actualiza en O(log n), sin
+# recorrer el catálogo. Los máximos usan montículos con borrado perezoso:
+# una entrada cuyo producto ya no tiene ese valor se descarta al llegar a
+# la cima. El valor total se acumula en Decimal para que sumar y restar el
+# mismo producto muchas veces no arrastre error de redondeo.
+class EstadisticasInventario:
+
+    def __init__(self, umbral_stock_bajo=9):
+        self.umbral_stock_bajo = umbral_stock_bajo
+        self.vigentes = {}           # id -> producto contado
+        self.valor_total = Decimal(0)
+        self.stock_bajo = 0          # productos con cantidad <= umbral
+        self.sin_stock = 0           # productos con cantidad 0
+        self._por_precio = []        # montículo (-precio, id)
+        self._por_cantidad = []      # montículo (-cantidad, id)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.vigentes)
+
+    @staticmethod
+    def _valor(p):
+        return Decimal(repr(float(p.precio))) * p.cantidad
+
+    # Cuenta un producto (si ya estaba se reemplaza)
+    def agregar(self, p):
+        with self._lock:
+            self._quitar(p.id)
+            self.vigentes[p.id] = p
+            self.valor_total += self._valor(p)
+            self.stock_bajo += p.cantidad <= self.umbral_stock_bajo
+            self.sin_stock += p.cantidad == 0
+            heapq.heappush(self._por_precio, (-p.precio, p.id))
+            heapq.heappush(self._por_cantidad, (-p.cantidad, p.id))
+            self._compactar()
+
+    def quitar(self, id):
+        with self._lock:
+            self._quitar(id)
+
+    def _quitar(self, id):
+        p = self.vigentes.pop(id, None)
+        if p is not None:
+            self.valor_total -= self._valor(p)
+            self.stock_bajo -= p.cantidad <= self.umbral_stock_bajo
+            self.sin_stock -= p.cantidad == 0
+
+    # Rehace los montículos cuando las entradas obsoletas superan a las vigentes
+    def _compactar(self):
+        if len(self._por_precio) + len(self._por_cantidad) > 4 * len(self.vigentes) + 64:
+            self._por_precio = [(-p.precio, id) for id, p in self.vigentes.items()]
+            self._por_cantidad = [(-p.cantidad, id) for id, p in self.vigentes.items()]
+            heapq.heapify(self._por_precio)
+            heapq.heapify(self._por_cantidad)
+
+    # Producto con el mayor valor del atributo, descartando entradas obsoletas
+    def _maximo(self, monticulo, atributo):
+        while monticulo:
+            valor, id = monticulo[0]
+            p = self.vigentes.get(id)
+            if p is not None and -valor == getattr(p, atributo):
+                return p
+            heapq.heappop(monticulo)
+        return None
+
+    def resumen(self):
+        with self._lock:
+            return self._formatear(
+                len(self.vigentes), self.valor_total, self.stock_bajo, self.sin_stock,
+                self._maximo(self._por_precio, 'precio'),
+                self._maximo(self._por_cantidad, 'cantidad'),
+                self.umbral_stock_bajo
+            )
+
+    @staticmethod
+    def _formatear(productos, valor_total, stock_bajo, sin_stock, mas_caro, mayor_stock, umbral):
+        return {
+            'productos': productos,
+            'valor_total': round(float(valor_total or 0), 2),
+            'stock_bajo': int(stock_bajo or 0),
+            'sin_stock': int(sin_stock or 0),
+            'umbral_stock_bajo': umbral,
+            'mas_caro': {'id': mas_caro.id, 'nombre': mas_caro.nombre,
+                         'precio': mas_caro.precio} if mas_caro else None,
+            'mayor_stock': {'id': mayor_stock.id, 'nombre': mayor_stock.nombre,
+                            'cantidad': mayor_stock.cantidad} if mayor_stock else None,
+        }
+
+    # Las mismas estadísticas calculadas en la base con agregados de SQL, sin
+    # traer las filas (para el gestor de consola o para contrastar la memoria)
+    @classmethod
+    def calcular_en_bd(cls, umbral_stock_bajo=9):
+        productos, valor_total, stock_bajo, sin_stock = db.session.query(
+            db.func.count(Producto.id),
+            db.func.sum(Producto.precio * Producto.cantidad),
+            db.func.sum(case((Producto.cantidad <= umbral_stock_bajo, 1), else_=0)),
+            db.func.sum(case((Producto.cantidad == 0, 1), else_=0)),
+        ).one()
+        columnas = (Producto.id, Producto.nombre, Producto.precio, Producto.cantidad)
+        mas_caro = (db.session.query(*columnas)
+                    .order_by(Producto.precio.desc(), Producto.id).first())
+        mayor_stock = (db.session.query(*columnas)
+                       .order_by(Producto.cantidad.desc(), Producto.id).first())
+        return cls._formatear(productos, valor_total, stock_bajo, sin_stock,
+                              mas_caro, mayor_stock, umbral_stock_bajo)
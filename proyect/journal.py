@@ -0,0 +1,134 @@
+from contextlib import contextmanager
+from datetime import datetime
+import csv
+import json
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Bloqueo exclusivo entre procesos sobre un archivo .lock auxiliar
+# (flock en Linux, msvcrt.locking en Windows)
+@contextmanager
+def bloqueo_archivo(ruta_lock):
+    with open(ruta_lock, 'a+') as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+# Convierte un producto en el registro que se guarda en los archivos de datos
+def registro_producto(producto, fecha=None):
+    return {
+        'id': producto.id,
+        'nombre': producto.nombre,
+        'cantidad': producto.cantidad,
+        'precio': float(producto.precio),
+        'imagen': producto.imagen,
+        'fecha_creacion': (fecha or datetime.now()).isoformat()
+    }
+
+# Diario de solo anexado (JSON Lines) para los datos exportados de productos.
+# Cada alta o edición agrega una línea; dato.json y dato.csv se regeneran
+# aparte con compactar(), fuera del ciclo de la petición.
+class DiarioProductos:
+
+    def __init__(self, carpeta='templates/datos'):
+        self.carpeta = carpeta
+        self.ruta_diario = os.path.join(carpeta, 'dato.jsonl')
+        self.ruta_json = os.path.join(carpeta, 'dato.json')
+        self.ruta_csv = os.path.join(carpeta, 'dato.csv')
+        self.ruta_lock = self.ruta_diario + '.lock'
+        os.makedirs(carpeta, exist_ok=True)
+
+    # Agrega registros al diario en una sola escritura, con bloqueo entre procesos
+    def anexar(self, registros, sincronizar=False):
+        lineas = ''.join(json.dumps(r, ensure_ascii=False) + '\n' for r in registros)
+        if not lineas:
+            return
+        with bloqueo_archivo(self.ruta_lock):
+            with open(self.ruta_diario, 'a', encoding='utf-8') as f:
+                f.write(lineas)
+                if sincronizar:
+                    f.flush()
+                    os.fsync(f.fileno())
+
+    def registrar(self, producto):
+        self.anexar([registro_producto(producto)])
+
+    # Interfaz de destino para EscritorAuditoria: un lote, un fsync
+    def escribir_lote(self, registros):
+        self.anexar(registros, sincronizar=True)
+
+    # Incorpora el diario a dato.json, regenera dato.csv y vacía el diario.
+    # El bloqueo se mantiene todo el proceso para no perder registros que
+    # lleguen mientras tanto. Devuelve cuántos registros se incorporaron.
+    def compactar(self):
+        with bloqueo_archivo(self.ruta_lock):
+            try:
+                with open(self.ruta_diario, 'r', encoding='utf-8') as f:
+                    nuevos = [json.loads(linea) for linea in f if linea.strip()]
+            except FileNotFoundError:
+                return 0
+            if not nuevos:
+                return 0
+            try:
+                with open(self.ruta_json, 'r', encoding='utf-8') as f:
+                    datos = json.load(f)
+            except (FileNotFoundError, json.JSONDecodeError):
+                datos = []
+            datos.extend(nuevos)
+            self._escribir_atomico(self.ruta_json, lambda f: json.dump(datos, f, ensure_ascii=False, indent=2))
+            self._escribir_atomico(self.ruta_csv, lambda f: self._volcar_csv(f, datos), newline='')
+            # Solo se vacía el diario cuando las instantáneas ya están en disco
+            open(self.ruta_diario, 'w').close()
+            return len(nuevos)
+
+    @staticmethod
+    def _volcar_csv(f, datos):
+        writer = csv.writer(f)
+        writer.writerow(['ID', 'Nombre', 'Cantidad', 'Precio', 'Imagen', 'Fecha_Creacion'])
+        for r in datos:
+            fecha = r.get('fecha_creacion')
+            try:
+                fecha = datetime.fromisoformat(fecha).strftime('%Y-%m-%d %H:%M:%S')
+            except (TypeError, ValueError):
+                pass
+            writer.writerow([r.get('id'), r.get('nombre'), r.get('cantidad'), r.get('precio'), r.get('imagen'), fecha])
+
+    # Escribe en un temporal y lo renombra: los lectores nunca ven un archivo a medias
+    @staticmethod
+    def _escribir_atomico(ruta, escribir, newline=None):
+        temporal = ruta + '.tmp'
+        with open(temporal, 'w', encoding='utf-8', newline=newline) as f:
+            escribir(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporal, ruta)
+
+    # Lanza un hilo que compacta cada 'intervalo' segundos
+    def iniciar_compactacion_periodica(self, intervalo):
+        def bucle():
+            while True:
+                time.sleep(intervalo)
+                try:
+                    self.compactar()
+                except Exception as e:
+                    print(f"Error compactando datos: {e}")
+        hilo = threading.Thread(target=bucle, name='compactacion-datos', daemon=True)
+        hilo.start()
+        return hilo
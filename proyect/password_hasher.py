@@ -0,0 +1,137 @@
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FuturoTimeout
+from concurrent.futures.process import BrokenProcessPool
+from werkzeug.security import generate_password_hash, check_password_hash, DEFAULT_PBKDF2_ITERATIONS
+import atexit
+import multiprocessing
+import os
+import threading
+
+# Se lanza cuando no hay sitio en la cola: la petición se rechaza enseguida
+# en lugar de esperar detrás de una ráfaga de inicios de sesión
+class HasherSaturado(Exception):
+    pass
+
+# Forma completa de un método de werkzeug ('scrypt' -> 'scrypt:32768:8:1'),
+# igual al prefijo que queda guardado en el hash
+def normalizar_metodo(metodo):
+    nombre, *args = metodo.split(':')
+    if nombre == 'scrypt':
+        return 'scrypt:' + ':'.join(args or ['32768', '8', '1'])
+    if nombre == 'pbkdf2':
+        hash_name = args[0] if args else 'sha256'
+        iteraciones = args[1] if len(args) > 1 else str(DEFAULT_PBKDF2_ITERATIONS)
+        return f'pbkdf2:{hash_name}:{iteraciones}'
+    raise ValueError(f'Método de hash no soportado: {metodo}')
+
+# True si el hash se generó con parámetros distintos a los configurados
+def necesita_rehash(pwhash, metodo):
+    return pwhash.split('$', 1)[0] != normalizar_metodo(metodo)
+
+# Funciones que se ejecutan en los procesos hijos del pool
+def _generar(password, metodo):
+    return generate_password_hash(password, method=metodo)
+
+def _verificar(pwhash, password, metodo):
+    if not check_password_hash(pwhash, password):
+        return False, None
+    # Contraseña correcta con parámetros viejos: se aprovecha que la tenemos
+    # en claro para calcular el hash nuevo en el mismo trabajo
+    if necesita_rehash(pwhash, metodo):
+        return True, generate_password_hash(password, method=metodo)
+    return True, None
+
+# Pool de procesos para los hash de contraseñas (scrypt/pbkdf2 consumen CPU a
+# propósito). Como mucho hay 'cola_max' trabajos pendientes o en curso; si se
+# llega al límite se lanza HasherSaturado sin esperar.
+class HasherContrasenas:
+
+    def __init__(self, procesos=2, cola_max=16, metodo='scrypt', espera_max=10):
+        self.procesos = procesos
+        self.cola_max = cola_max
+        self.metodo = normalizar_metodo(metodo)
+        self.espera_max = espera_max
+        self._pool = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._pendientes = 0
+        self.metricas = {'generados': 0, 'verificados': 0, 'rehash': 0, 'rechazados': 0}
+
+    # Pool perezoso y por proceso, con hijos lanzados con 'spawn' como en
+    # ProcesadorImagenes (sin fork de un proceso con hilos en marcha)
+    def _obtener_pool(self):
+        if self._pool is None or self._pid != os.getpid():
+            self._pool = ProcessPoolExecutor(max_workers=self.procesos,
+                                             mp_context=multiprocessing.get_context('spawn'))
+            self._pid = os.getpid()
+            atexit.register(self._pool.shutdown, wait=False, cancel_futures=True)
+        return self._pool
+
+    # Descarta un pool roto (un hijo murió, p. ej. por falta de memoria)
+    def _descartar_pool(self, pool):
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+        pool.shutdown(wait=False)
+
+    # Si el pool está roto al enviar o al esperar el resultado, se descarta y
+    # se reintenta una vez con uno nuevo (generar y verificar no tienen efectos)
+    def _ejecutar(self, funcion, *args):
+        for intento in range(2):
+            with self._lock:
+                if self._pendientes >= self.cola_max:
+                    self.metricas['rechazados'] += 1
+                    raise HasherSaturado('Demasiadas operaciones de contraseña en curso')
+                self._pendientes += 1
+                try:
+                    pool = self._obtener_pool()
+                    futuro = pool.submit(funcion, *args)
+                except BrokenProcessPool:
+                    self._pendientes -= 1
+                    futuro = None
+                except Exception:
+                    self._pendientes -= 1
+                    raise
+            if futuro is None:
+                self._descartar_pool(pool)
+                if intento:
+                    raise BrokenProcessPool('El pool de contraseñas no se pudo recuperar')
+                continue
+            futuro.add_done_callback(self._terminado)
+            try:
+                return futuro.result(timeout=self.espera_max)
+            except FuturoTimeout:
+                futuro.cancel()
+                raise HasherSaturado('La operación de contraseña tardó demasiado')
+            except BrokenProcessPool:
+                self._descartar_pool(pool)
+                if intento:
+                    raise
+
+    def _terminado(self, futuro):
+        with self._lock:
+            self._pendientes -= 1
+
+    # Hash de una contraseña nueva con el método configurado
+    def generar(self, password):
+        pwhash = self._ejecutar(_generar, password, self.metodo)
+        with self._lock:
+            self.metricas['generados'] += 1
+        return pwhash
+
+    # Devuelve (valida, nuevo_hash); nuevo_hash no es None cuando hay que
+    # guardar el hash recalculado con los parámetros actuales
+    def verificar(self, pwhash, password):
+        valida, nuevo_hash = self._ejecutar(_verificar, pwhash, password, self.metodo)
+        with self._lock:
+            self.metricas['verificados'] += 1
+            if nuevo_hash:
+                self.metricas['rehash'] += 1
+        return valida, nuevo_hash
+
+    def estado(self):
+        with self._lock:
+            datos = dict(self.metricas)
+            datos['pendientes'] = self._pendientes
+        datos['cola_max'] = self.cola_max
+        datos['metodo'] = self.metodo
+        return datos
@@ -0,0 +1,91 @@
+import unicodedata
+
+# Normaliza un texto para búsqueda: minúsculas y sin tildes ("Café" -> "cafe")
+def normalizar(texto):
+    descompuesto = unicodedata.normalize('NFKD', (texto or '').casefold())
+    return ''.join(c for c in descompuesto if not unicodedata.combining(c))
+
+# Devuelve el conjunto de trigramas (subcadenas de 3 caracteres) de un texto ya normalizado
+def trigramas(texto):
+    return {texto[i:i + 3] for i in range(len(texto) - 2)}
+
+# Clave de relevancia de un texto normalizado que contiene la consulta:
+# coincidencia exacta, luego prefijo, luego inicio de palabra y por último
+# cualquier posición (antes es mejor). Termina en el id para desempatar.
+def clave_relevancia(texto, consulta, id):
+    if texto == consulta:
+        nivel = 0
+    elif texto.startswith(consulta):
+        nivel = 1
+    elif (' ' + consulta) in texto:
+        nivel = 2
+    else:
+        nivel = 3
+    return (nivel, texto.find(consulta), len(texto), texto, id)
+
+# Índice invertido de trigramas para búsquedas por subcadena
+class IndiceTrigramas:
+    # Textos normalizados por id {id: 'cafe molido'}
+    # Listas de apariciones por trigrama {'caf': {id, ...}}
+
+    def __init__(self):
+        self.textos = {}
+        self.postings = {}
+
+    def __len__(self):
+        return len(self.textos)
+
+    # Indexa (o reindexa) un texto bajo un id
+    def agregar(self, id, texto):
+        if id in self.textos:
+            self.eliminar(id)
+        normal = normalizar(texto)
+        self.textos[id] = normal
+        for t in trigramas(normal):
+            self.postings.setdefault(t, set()).add(id)
+
+    # Quita un id del índice
+    def eliminar(self, id):
+        normal = self.textos.pop(id, None)
+        if normal is None:
+            return
+        for t in trigramas(normal):
+            ids = self.postings.get(t)
+            if ids is not None:
+                ids.discard(id)
+                if not ids:
+                    del self.postings[t]
+
+    # Ids cuyo texto contiene la consulta (ninguno si está vacía). Con 3 o
+    # más caracteres se intersectan las listas de trigramas empezando por la
+    # más corta; las consultas más cortas recorren los textos ya normalizados.
+    def candidatos(self, consulta):
+        if not consulta:
+            return []
+        if len(consulta) < 3:
+            return [id for id, texto in self.textos.items() if consulta in texto]
+        listas = []
+        for t in trigramas(consulta):
+            ids = self.postings.get(t)
+            if not ids:
+                return []
+            listas.append(ids)
+        listas.sort(key=len)
+        resultado = set(listas[0])
+        for ids in listas[1:]:
+            resultado &= ids
+            if not resultado:
+                return []
+        # Los trigramas son condición necesaria, no suficiente: se verifica la subcadena
+        return [id for id in resultado if consulta in self.textos[id]]
+
+    def _relevancia(self, id, consulta):
+        return clave_relevancia(self.textos[id], consulta, id)
+
+    # Busca la consulta y devuelve las claves de relevancia ordenadas
+    # (cada clave termina en el id, sirven también como cursor de paginación)
+    def buscar_claves(self, consulta):
+        consulta = normalizar(consulta).strip()
+        if not consulta:
+            return []
+        return sorted(self._relevancia(id, consulta) for id in self.candidatos(consulta))
@@ -0,0 +1,79 @@
+from bisect import bisect_left, bisect_right, insort
+
+# Índice ordenado mantenido con bisect: una lista de claves ordenadas
+# (cada clave termina en el id para ser única) y la clave vigente de cada id
+class IndiceOrdenado:
+
+    def __init__(self, funcion_clave):
+        self.funcion_clave = funcion_clave
+        self.claves = []
+        self.por_id = {}
+
+    def __len__(self):
+        return len(self.claves)
+
+    # Inserta (o reubica) un objeto según su clave actual
+    def agregar(self, obj):
+        clave = self.funcion_clave(obj)
+        anterior = self.por_id.get(clave[-1])
+        if anterior == clave:
+            return
+        if anterior is not None:
+            self._quitar_clave(anterior)
+        insort(self.claves, clave)
+        self.por_id[clave[-1]] = clave
+
+    # Quita un id del índice
+    def eliminar(self, id):
+        clave = self.por_id.pop(id, None)
+        if clave is not None:
+            self._quitar_clave(clave)
+
+    def _quitar_clave(self, clave):
+        i = bisect_left(self.claves, clave)
+        if i < len(self.claves) and self.claves[i] == clave:
+            del self.claves[i]
+
+    # Clave registrada para un id (sirve para ordenar subconjuntos)
+    def clave(self, id):
+        return self.por_id[id]
+
+    # Claves cuyo valor (primer componente) está entre minimo y maximo, ambos
+    # incluidos; None deja ese extremo abierto. Dos bisecciones y un corte.
+    def rango(self, minimo=None, maximo=None):
+        inicio = 0 if minimo is None else bisect_left(self.claves, (minimo,))
+        fin = len(self.claves) if maximo is None else bisect_right(self.claves, (maximo, float('inf')))
+        return self.claves[inicio:fin]
+
+# Paginación por cursor (keyset) sobre cualquier lista de claves ordenada de
+# forma ascendente. 'despues' y 'antes' son claves de borde de la página
+# vecina; en orden descendente se recorre la lista al revés. Devuelve las
+# claves de la página y si existen páginas anterior y siguiente.
+def paginar(claves, limite, despues=None, antes=None, desc=False):
+    n = len(claves)
+    if antes is not None:
+        # Página previa: los 'limite' elementos inmediatamente anteriores al cursor
+        if desc:
+            inicio = bisect_right(claves, antes)
+            fin = min(n, inicio + limite)
+        else:
+            fin = bisect_left(claves, antes)
+            inicio = max(0, fin - limite)
+    elif despues is not None:
+        if desc:
+            fin = bisect_left(claves, despues)
+            inicio = max(0, fin - limite)
+        else:
+            inicio = bisect_right(claves, despues)
+            fin = min(n, inicio + limite)
+    elif desc:
+        fin = n
+        inicio = max(0, n - limite)
+    else:
+        inicio = 0
+        fin = min(n, limite)
+    pagina = claves[inicio:fin]
+    if desc:
+        pagina = pagina[::-1]
+        return pagina, fin < n, inicio > 0
+    return pagina, inicio > 0, fin < n
@@ -0,0 +1,25 @@
+import os
+import sys
+
+import pytest
+from flask import Flask
+
+# Los módulos del proyecto son planos (se importan como 'inventory',
+# 'search_index', ...), igual que al arrancar app.py desde esta carpeta
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import db
+
+
+# Aplicación mínima con una base SQLite en memoria y las tablas creadas; la
+# prueba corre dentro de su contexto (sin las rutas ni los servicios de app.py)
+@pytest.fixture
+def app_bd():
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    app.config['SQLALCHEMY_BINDS'] = {}
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
@@ -0,0 +1,83 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from change_log import SincronizadorCambios
+from models import db, RegistroCambio
+
+
+def insertar(*ids, fecha=None):
+    for id in ids:
+        db.session.add(RegistroCambio(id=id, entidad='producto', entidad_id=id * 10,
+                                      accion='guardar', fecha=fecha or datetime.now()))
+    db.session.commit()
+
+
+@pytest.fixture
+def recibidos():
+    return []
+
+
+@pytest.fixture
+def sincronizador(app_bd, recibidos):
+    sincronizador = SincronizadorCambios(espera_huecos=60)
+    sincronizador.suscribir('producto', lambda cambios: recibidos.extend(c.id for c in cambios))
+    return sincronizador
+
+
+def test_aplica_los_cambios_nuevos(sincronizador, recibidos):
+    insertar(1, 2)
+    assert sincronizador.sincronizar() == 2
+    assert recibidos == [1, 2]
+    assert sincronizador.version == 2
+    assert sincronizador.sincronizar() == 0
+
+
+def test_id_que_confirma_tarde_no_se_pierde(sincronizador, recibidos):
+    # La transacción con id 3 confirma después que la del 4
+    insertar(1, 2, 4)
+    sincronizador.sincronizar()
+    assert sincronizador.version == 4
+    assert set(sincronizador.huecos) == {3}
+    insertar(3)
+    assert sincronizador.sincronizar() == 1
+    assert recibidos == [1, 2, 4, 3]
+    assert sincronizador.huecos == {}
+
+
+def test_hueco_caducado_se_da_por_perdido(sincronizador, recibidos):
+    insertar(1, 3)
+    sincronizador.sincronizar()
+    assert set(sincronizador.huecos) == {2}
+    sincronizador.espera_huecos = 0
+    insertar(2)
+    assert sincronizador.sincronizar() == 0
+    assert sincronizador.huecos == {}
+    assert recibidos == [1, 3]
+
+
+def test_version_de_partida_anota_los_huecos_recientes(sincronizador, recibidos):
+    insertar(1, 2, 5)
+    assert sincronizador.marcar_version_actual() == 5
+    assert set(sincronizador.huecos) == {3, 4}
+    insertar(4)
+    sincronizador.sincronizar()
+    assert recibidos == [4]
+
+
+def test_saltos_grandes_solo_anotan_los_ultimos_ids(sincronizador):
+    insertar(1, 1 + SincronizadorCambios.MAX_HUECO + 50)
+    sincronizador.sincronizar()
+    assert len(sincronizador.huecos) == SincronizadorCambios.MAX_HUECO
+    assert min(sincronizador.huecos) == 51
+
+
+def test_podar_respeta_retencion_y_version(sincronizador):
+    viejo = datetime.now() - timedelta(days=10)
+    insertar(1, 2, 3, fecha=viejo)
+    insertar(4)
+    sincronizador.sincronizar()
+    insertar(5, fecha=viejo)
+    # 5 es viejo pero posterior a la versión: otro worker aún puede necesitarlo
+    assert sincronizador.podar(retencion=7 * 86400) == 3
+    assert [c.id for c in RegistroCambio.query.order_by(RegistroCambio.id)] == [4, 5]
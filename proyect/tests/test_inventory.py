@@ -0,0 +1,133 @@
+import base64
+import json
+from datetime import datetime
+
+import pytest
+
+from inventory import Inventario, RegistroProducto
+
+
+def registro(id, nombre, cantidad, precio):
+    fecha = datetime(2024, 1, id)
+    return RegistroProducto(id, nombre, nombre.lower(), cantidad, precio, 'default.jpg', fecha, fecha)
+
+
+@pytest.fixture
+def inventario():
+    productos = [registro(i, f'Producto {i}', i * 3, i * 1.5) for i in range(1, 8)]
+    return Inventario({p.id: p for p in productos})
+
+
+def cursor(valores):
+    texto = json.dumps(valores).encode('utf-8')
+    return base64.urlsafe_b64encode(texto).decode('ascii').rstrip('=')
+
+
+def test_cursor_ida_y_vuelta(inventario):
+    for orden in [None, *Inventario.ORDENES]:
+        q = 'producto' if orden is None else None
+        primera = inventario.listar_pagina(limit=3, q=q, orden=orden)
+        segunda = inventario.listar_pagina(limit=3, q=q, orden=orden, after=primera.siguiente)
+        assert len(segunda.productos) == 3
+        assert not {p.id for p in primera.productos} & {p.id for p in segunda.productos}
+        volver = inventario.listar_pagina(limit=3, q=q, orden=orden, before=segunda.anterior)
+        assert volver.productos == primera.productos
+
+
+@pytest.mark.parametrize('orden, valores', [
+    ('precio', ['x', 1]),
+    ('precio', [True, 1]),
+    ('nombre', [1, 1]),
+    ('nombre', ['producto 1', '1']),
+    ('cantidad', [1.5, 1]),
+    ('fecha_creacion', ['no es fecha', 1]),
+    ('fecha_creacion', [3, 1]),
+    (None, ['producto', 0, 0, 'producto', 1]),
+    (None, [0, 0, 0, 'producto']),
+    ('precio', {'precio': 1}),
+])
+def test_cursor_manipulado_o_de_otro_orden(inventario, orden, valores):
+    assert Inventario._decodificar_cursor(cursor(valores), orden) is None
+    q = 'producto' if orden is None else None
+    # Se ignora y se devuelve la primera página
+    pagina = inventario.listar_pagina(limit=2, q=q, orden=orden, after=cursor(valores))
+    assert pagina.productos == inventario.listar_pagina(limit=2, q=q, orden=orden).productos
+
+
+def test_cursor_que_no_es_base64_ni_json(inventario):
+    assert Inventario._decodificar_cursor('%%%', 'nombre') is None
+    assert Inventario._decodificar_cursor(cursor('texto')[:-2], 'nombre') is None
+    assert inventario.listar_pagina(limit=2, before='no-es-un-cursor').total == 7
+
+
+@pytest.fixture
+def inventario_bd(app_bd):
+    inventario = Inventario()
+    inventario.recargar()
+    for nombre, cantidad in [('Café', 5), ('Té', 0), ('Azúcar', 10)]:
+        inventario.agregar(nombre, cantidad, 2.0)
+    return inventario
+
+
+def cantidades_bd():
+    from models import Producto
+    return {p.id: p.cantidad for p in Producto.query.order_by(Producto.id)}
+
+
+def cambios_de_producto():
+    from models import RegistroCambio
+    return RegistroCambio.query.filter_by(entidad='producto').count()
+
+
+def test_ajustar_stock_descuenta_y_actualiza_la_memoria(inventario_bd):
+    antes = cambios_de_producto()
+    ajuste = inventario_bd.ajustar_stock([(1, -2), (3, 4)])
+    assert ajuste.cantidades == {1: 3, 3: 14}
+    assert ajuste.fallidas == []
+    assert cantidades_bd() == {1: 3, 2: 0, 3: 14}
+    assert inventario_bd.obtener(1).cantidad == 3
+    assert [p.id for p in inventario_bd.iterar(orden='cantidad')] == [2, 1, 3]
+    # El UPDATE del Core se anota a mano en el registro de cambios
+    assert cambios_de_producto() == antes + 2
+
+
+def test_ajustar_stock_sin_stock_es_todo_o_nada(inventario_bd):
+    antes = cambios_de_producto()
+    ajuste = inventario_bd.ajustar_stock([(1, -1), (2, -1), (3, -11)])
+    assert ajuste.cantidades == {}
+    assert ajuste.fallidas == [{'linea': 1, 'id': 2, 'motivo': 'sin_stock'},
+                               {'linea': 2, 'id': 3, 'motivo': 'sin_stock'}]
+    # La línea que sí cabía también se deshace
+    assert cantidades_bd() == {1: 5, 2: 0, 3: 10}
+    assert inventario_bd.obtener(1).cantidad == 5
+    assert cambios_de_producto() == antes
+
+
+def test_ajustar_stock_id_desconocido(inventario_bd):
+    ajuste = inventario_bd.ajustar_stock([(99, -1), (1, -1)])
+    assert ajuste.cantidades == {}
+    assert ajuste.fallidas == [{'linea': 0, 'id': 99, 'motivo': 'no_existe'}]
+    assert cantidades_bd()[1] == 5
+
+
+def test_ajustar_stock_parcial(inventario_bd):
+    ajuste = inventario_bd.ajustar_stock([(3, -4), (2, -1), (99, 1), (1, -5)], todo_o_nada=False)
+    assert ajuste.cantidades == {1: 0, 3: 6}
+    assert ajuste.fallidas == [{'linea': 1, 'id': 2, 'motivo': 'sin_stock'},
+                               {'linea': 2, 'id': 99, 'motivo': 'no_existe'}]
+    assert cantidades_bd() == {1: 0, 2: 0, 3: 6}
+    assert inventario_bd.obtener(1).cantidad == 0
+
+
+def test_ajustar_stock_ninguna_linea_valida(inventario_bd):
+    ajuste = inventario_bd.ajustar_stock([(2, -1)], todo_o_nada=False)
+    assert ajuste.cantidades == {}
+    assert ajuste.fallidas[0]['motivo'] == 'sin_stock'
+    assert cantidades_bd() == {1: 5, 2: 0, 3: 10}
+
+
+def test_ajustar_stock_misma_linea_repetida(inventario_bd):
+    # Dos líneas del mismo producto se aplican una tras otra
+    ajuste = inventario_bd.ajustar_stock([(1, -3), (1, -3)])
+    assert ajuste.fallidas == [{'linea': 1, 'id': 1, 'motivo': 'sin_stock'}]
+    assert cantidades_bd()[1] == 5
@@ -0,0 +1,158 @@
+from bisect import bisect_left
+from datetime import datetime
+
+import pytest
+
+from inventory import CatalogoMemoria, Inventario, RegistroProducto
+from inventory_snapshot import (InstantaneaInventario, VistaInstantanea,
+                                escribir_instantanea)
+
+
+def registro(id, nombre, cantidad, precio, imagen='default.jpg', fecha_creacion=None):
+    fecha = fecha_creacion or datetime(2024, 1, id, 10, 30, 15, 123456)
+    return RegistroProducto(id, nombre, nombre.lower(), cantidad, precio, imagen,
+                            fecha, fecha)
+
+
+PRODUCTOS = [
+    registro(3, 'Café molido', 5, 4.5),
+    registro(1, 'cafetera', 0, 39.99, imagen='ab12.webp'),
+    registro(7, 'Té verde', 12, 2.25),
+    registro(2, 'Azúcar', 5, 1.0, fecha_creacion=datetime(2023, 6, 1)),
+    registro(9, 'Leche de café', 30, 1.75, imagen=None),
+]
+ESTADISTICAS = {'productos': 5, 'valor_total': 104.25}
+
+
+@pytest.fixture
+def vista(tmp_path):
+    ruta = tmp_path / 'inventario.snap.1'
+    escribir_instantanea(str(ruta), PRODUCTOS, 42, ESTADISTICAS)
+    return VistaInstantanea(str(ruta))
+
+
+@pytest.fixture
+def catalogo():
+    return CatalogoMemoria(Inventario.ORDENES, 9, PRODUCTOS)
+
+
+def test_registros_ida_y_vuelta(vista):
+    assert vista.version == 42
+    assert len(vista) == len(PRODUCTOS)
+    assert vista.estadisticas == ESTADISTICAS
+    esperados = sorted(PRODUCTOS, key=lambda p: p.id)
+    assert vista.registros() == esperados
+    assert vista.obtener(3) == esperados[2]
+    assert vista.obtener(3).fecha_creacion == datetime(2024, 1, 3, 10, 30, 15, 123456)
+    assert vista.obtener(4) is None
+    assert vista.obtener(100) is None
+
+
+def test_no_sobrescribe_un_archivo_existente(tmp_path):
+    ruta = str(tmp_path / 'inventario.snap.1')
+    escribir_instantanea(ruta, PRODUCTOS, 1)
+    with pytest.raises(FileExistsError):
+        escribir_instantanea(ruta, PRODUCTOS, 2)
+
+
+@pytest.mark.parametrize('orden', list(Inventario.ORDENES))
+def test_ordenes_como_en_memoria(vista, catalogo, orden):
+    assert list(vista.claves(orden)) == list(catalogo.claves(orden))
+    for p in PRODUCTOS:
+        assert vista.clave(orden, p.id) == catalogo.clave(orden, p.id)
+
+
+@pytest.mark.parametrize('orden, minimo, maximo', [
+    ('precio', 1.75, 4.5),
+    ('precio', None, 2.0),
+    ('precio', 40, None),
+    ('cantidad', 5, 5),
+    ('cantidad', 6, None),
+])
+def test_rangos_como_en_memoria(vista, catalogo, orden, minimo, maximo):
+    assert list(vista.rango(orden, minimo, maximo)) == list(catalogo.rango(orden, minimo, maximo))
+
+
+def test_claves_admiten_cortes_y_bisect(vista):
+    claves = vista.claves('precio')
+    assert claves[1:3] == list(claves)[1:3]
+    assert claves[-1] == list(claves)[-1]
+    assert bisect_left(claves, (2.25, 7)) == 2
+    assert bisect_left(claves, (2.0, 0)) == 2
+
+
+@pytest.mark.parametrize('q', ['cafe', 'CAFÉ', 'te', 'e', 'leche de', 'xyz'])
+def test_busqueda_como_en_memoria(vista, catalogo, q):
+    assert vista.buscar_claves(q) == catalogo.buscar_claves(q)
+
+
+def test_id_por_nombre(vista, catalogo):
+    for nombre in ('azúcar', 'café molido', 'té', 'cafetera '):
+        assert vista.id_por_nombre(nombre) == catalogo.id_por_nombre(nombre)
+    assert vista.id_por_nombre('azúcar') == 2
+
+
+def test_instantanea_vacia(tmp_path):
+    ruta = str(tmp_path / 'inventario.snap.1')
+    escribir_instantanea(ruta, [], 0)
+    vista = VistaInstantanea(ruta)
+    assert len(vista) == 0
+    assert vista.registros() == []
+    assert list(vista.claves('nombre')) == []
+    assert vista.buscar_claves('cafe') == []
+
+
+def test_publicar_y_leer_por_el_puntero(tmp_path):
+    ruta = str(tmp_path / 'inventario.snap')
+    escritor = InstantaneaInventario(ruta)
+    lector = InstantaneaInventario(ruta)
+    assert lector.actual() is None
+    assert escritor.intentar_ser_escritor()
+    # El bloqueo es de archivo: una segunda instancia no puede escribir
+    assert not lector.intentar_ser_escritor()
+    with pytest.raises(RuntimeError):
+        lector.publicar(PRODUCTOS, 1)
+
+    escritor.publicar(PRODUCTOS[:2], 1)
+    primera = lector.actual()
+    assert primera.version == 1 and len(primera) == 2
+    escritor.publicar(PRODUCTOS, 2)
+    escritor.publicar(PRODUCTOS, 3)
+    segunda = lector.actual()
+    assert segunda.version == 3 and len(segunda) == len(PRODUCTOS)
+    # La vista ya abierta sigue siendo legible aunque se publiquen otras
+    assert primera.obtener(1).nombre == 'cafetera'
+    # Se conserva la vigente y CONSERVAR anteriores
+    publicadas = [f for f in tmp_path.iterdir() if f.name.startswith('inventario.snap.') and not f.name.endswith('.lock')]
+    assert len(publicadas) <= 1 + InstantaneaInventario.CONSERVAR
+
+
+def test_consulta_que_se_normaliza_a_vacia(vista, catalogo):
+    # Una tilde suelta no la quita strip() pero normalizar() sí
+    assert vista.candidatos('') == []
+    assert catalogo.candidatos('') == []
+    assert vista.buscar_claves('́') == []
+
+
+@pytest.fixture
+def inventarios(tmp_path):
+    ruta = str(tmp_path / 'inventario.snap')
+    memoria = Inventario({p.id: p for p in PRODUCTOS})
+    escritor = InstantaneaInventario(ruta)
+    escritor.intentar_ser_escritor()
+    escritor.publicar(PRODUCTOS, 1)
+    lector = Inventario()
+    lector.instantanea = InstantaneaInventario(ruta)
+    return memoria, lector
+
+
+@pytest.mark.parametrize('orden', [None, 'precio'])
+def test_tilde_suelta_equivale_a_sin_consulta(inventarios, orden):
+    todos = sorted(p.id for p in PRODUCTOS)
+    for inventario in inventarios:
+        ids = [p.id for p in inventario.iterar(q='́', orden=orden)]
+        assert sorted(ids) == todos
+        assert inventario.contar(q='́') == len(PRODUCTOS)
+        pagina = inventario.listar_pagina(limit=2, q='́', orden=orden)
+        assert pagina.total == len(PRODUCTOS)
+        assert inventario.buscar_por_nombre('́') == []
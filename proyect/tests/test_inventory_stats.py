@@ -0,0 +1,82 @@
+import pytest
+
+from inventory import Inventario, RegistroProducto
+from inventory_stats import EstadisticasInventario
+
+
+@pytest.fixture
+def inventario(app_bd):
+    inventario = Inventario(umbral_stock_bajo=9)
+    inventario.recargar()
+    return inventario
+
+
+def producto(id, precio, cantidad):
+    return RegistroProducto(id, f'P{id}', f'p{id}', cantidad, precio, 'default.jpg', None, None)
+
+
+def comparar(inventario):
+    en_memoria = inventario.resumen_estadisticas()
+    assert en_memoria == EstadisticasInventario.calcular_en_bd(9)
+    return en_memoria
+
+
+def test_catalogo_vacio(inventario):
+    resumen = comparar(inventario)
+    assert resumen['productos'] == 0
+    assert resumen['mas_caro'] is None and resumen['mayor_stock'] is None
+
+
+def test_coincide_con_la_base_tras_altas_cambios_y_bajas(inventario):
+    inventario.agregar('Café', 5, 4.5)
+    inventario.agregar('Té', 0, 2.25)
+    inventario.agregar('Azúcar', 30, 1.1)
+    resumen = comparar(inventario)
+    assert resumen['productos'] == 3
+    assert resumen['valor_total'] == 55.5
+    assert (resumen['stock_bajo'], resumen['sin_stock']) == (2, 1)
+    assert resumen['mas_caro']['nombre'] == 'Café'
+    assert resumen['mayor_stock']['nombre'] == 'Azúcar'
+
+    # El más caro baja de precio y el de más stock se queda sin unidades
+    inventario.actualizar(1, precio=1.0)
+    inventario.actualizar(3, cantidad=0)
+    resumen = comparar(inventario)
+    assert resumen['mas_caro']['nombre'] == 'Té'
+    assert resumen['mayor_stock']['nombre'] == 'Café'
+    assert resumen['sin_stock'] == 2
+
+    inventario.ajustar_stock([(2, 12)])
+    inventario.eliminar(1)
+    resumen = comparar(inventario)
+    assert resumen['productos'] == 2
+    assert resumen['mayor_stock']['nombre'] == 'Té'
+    assert resumen['stock_bajo'] == 1
+
+
+def test_empates_se_resuelven_por_id(inventario):
+    inventario.agregar('B', 7, 3.0)
+    inventario.agregar('A', 7, 3.0)
+    resumen = comparar(inventario)
+    assert resumen['mas_caro']['id'] == 1
+    assert resumen['mayor_stock']['id'] == 1
+
+
+def test_sumar_y_restar_muchas_veces_no_acumula_error():
+    estadisticas = EstadisticasInventario()
+    fijo = producto(1, 0.1, 3)
+    estadisticas.agregar(fijo)
+    for i in range(1000):
+        estadisticas.agregar(producto(2, 0.7 + i % 3 / 10, 9))
+    estadisticas.quitar(2)
+    assert estadisticas.valor_total == estadisticas._valor(fijo)
+    assert estadisticas.resumen()['valor_total'] == 0.3
+
+
+def test_compacta_los_monticulos():
+    estadisticas = EstadisticasInventario()
+    for i in range(500):
+        estadisticas.agregar(producto(i % 5, float(i), i))
+    assert len(estadisticas) == 5
+    assert len(estadisticas._por_precio) <= 4 * 5 + 64 + 1
+    assert estadisticas.resumen()['mas_caro']['precio'] == 499.0
@@ -0,0 +1,77 @@
+from search_index import IndiceTrigramas, normalizar, clave_relevancia
+
+
+# Ids en el orden de relevancia, como los recorre Inventario
+def buscar(indice, q):
+    return [clave[-1] for clave in indice.buscar_claves(q)]
+
+
+def indice_con(nombres):
+    indice = IndiceTrigramas()
+    for id, nombre in enumerate(nombres, start=1):
+        indice.agregar(id, nombre)
+    return indice
+
+
+def test_normalizar_quita_tildes_y_mayusculas():
+    assert normalizar('Café CON Leche') == 'cafe con leche'
+    assert normalizar('Ñandú') == 'nandu'
+    assert normalizar(None) == ''
+
+
+def test_busqueda_ignora_tildes_en_texto_y_consulta():
+    indice = indice_con(['Café molido', 'cafetera', 'Té verde'])
+    assert sorted(buscar(indice, 'cafe')) == [1, 2]
+    assert sorted(buscar(indice, 'CAFÉ')) == [1, 2]
+    assert buscar(indice, 'te v') == [3]
+
+
+def test_consultas_cortas_recorren_los_textos():
+    indice = indice_con(['Té verde', 'Azúcar', 'Leche'])
+    assert sorted(buscar(indice, 'e')) == [1, 3]
+    assert buscar(indice, 'az') == [2]
+    assert buscar(indice, 'ú') == [2]
+
+
+def test_consulta_vacia_o_sin_coincidencias():
+    indice = indice_con(['Café'])
+    assert buscar(indice, '') == []
+    assert buscar(indice, '   ') == []
+    assert buscar(indice, 'xyz') == []
+
+
+def test_trigramas_presentes_pero_no_contiguos():
+    # El texto tiene los trigramas de 'abca' ('abc' y 'bca') pero no la subcadena
+    indice = indice_con(['abc bca cab'])
+    assert buscar(indice, 'abca') == []
+
+
+def test_orden_por_relevancia():
+    indice = indice_con(['leche de café', 'Café', 'cafetera', 'Café molido', 'descafeinado'])
+    # exacta, prefijo (más corto antes), inicio de palabra, cualquier posición
+    assert buscar(indice, 'café') == [2, 3, 4, 1, 5]
+    claves = indice.buscar_claves('cafe')
+    assert claves == sorted(claves)
+    assert claves[0] == clave_relevancia('cafe', 'cafe', 2)
+
+
+def test_reindexar_y_eliminar():
+    indice = indice_con(['Café', 'Té'])
+    indice.agregar(1, 'Leche')
+    assert buscar(indice, 'cafe') == []
+    assert buscar(indice, 'leche') == [1]
+    indice.eliminar(1)
+    indice.eliminar(99)
+    assert len(indice) == 1
+    assert buscar(indice, 'leche') == []
+    # No quedan listas vacías de trigramas
+    assert all(indice.postings.values())
+
+
+def test_candidatos_con_consulta_ya_normalizada():
+    # Inventario normaliza la consulta una vez y pide los candidatos sin orden
+    indice = indice_con(['Café molido', 'cafetera', 'Té verde'])
+    assert sorted(indice.candidatos(normalizar('CAFÉ'))) == [1, 2]
+    assert sorted(indice.candidatos('e')) == [1, 2, 3]
+    assert indice.candidatos('') == []
+    assert indice.candidatos(normalizar('́')) == []
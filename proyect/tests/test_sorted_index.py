@@ -0,0 +1,107 @@
+from collections import namedtuple
+
+from sorted_index import IndiceOrdenado, paginar
+
+# Claves (valor, id) como las que guarda IndiceOrdenado
+CLAVES = [(i * 10, i) for i in range(1, 8)]   # (10, 1) ... (70, 7)
+
+Item = namedtuple('Item', 'id precio')
+
+
+def ids(pagina):
+    return [clave[-1] for clave in pagina]
+
+
+def test_primera_pagina_ascendente():
+    pagina, anterior, siguiente = paginar(CLAVES, 3)
+    assert ids(pagina) == [1, 2, 3]
+    assert (anterior, siguiente) == (False, True)
+
+
+def test_primera_pagina_descendente():
+    pagina, anterior, siguiente = paginar(CLAVES, 3, desc=True)
+    assert ids(pagina) == [7, 6, 5]
+    assert (anterior, siguiente) == (False, True)
+
+
+def test_despues_ascendente():
+    pagina, anterior, siguiente = paginar(CLAVES, 3, despues=(30, 3))
+    assert ids(pagina) == [4, 5, 6]
+    assert (anterior, siguiente) == (True, True)
+    pagina, anterior, siguiente = paginar(CLAVES, 3, despues=(60, 6))
+    assert ids(pagina) == [7]
+    assert (anterior, siguiente) == (True, False)
+
+
+def test_despues_descendente():
+    pagina, anterior, siguiente = paginar(CLAVES, 3, despues=(50, 5), desc=True)
+    assert ids(pagina) == [4, 3, 2]
+    assert (anterior, siguiente) == (True, True)
+    pagina, anterior, siguiente = paginar(CLAVES, 3, despues=(20, 2), desc=True)
+    assert ids(pagina) == [1]
+    assert (anterior, siguiente) == (True, False)
+
+
+def test_antes_ascendente():
+    pagina, anterior, siguiente = paginar(CLAVES, 3, antes=(50, 5))
+    assert ids(pagina) == [2, 3, 4]
+    assert (anterior, siguiente) == (True, True)
+    pagina, anterior, siguiente = paginar(CLAVES, 3, antes=(30, 3))
+    assert ids(pagina) == [1, 2]
+    assert (anterior, siguiente) == (False, True)
+
+
+def test_antes_descendente():
+    pagina, anterior, siguiente = paginar(CLAVES, 3, antes=(30, 3), desc=True)
+    assert ids(pagina) == [6, 5, 4]
+    assert (anterior, siguiente) == (True, True)
+    pagina, anterior, siguiente = paginar(CLAVES, 3, antes=(50, 5), desc=True)
+    assert ids(pagina) == [7, 6]
+    assert (anterior, siguiente) == (False, True)
+
+
+def test_cursor_que_ya_no_existe():
+    # El producto del cursor se borró: la página sigue desde donde estaría
+    pagina, _, _ = paginar(CLAVES, 2, despues=(35, 99))
+    assert ids(pagina) == [4, 5]
+    pagina, _, _ = paginar(CLAVES, 2, antes=(35, 99), desc=True)
+    assert ids(pagina) == [5, 4]
+
+
+def test_recorrido_completo_ida_y_vuelta():
+    for desc in (False, True):
+        vistas, despues = [], None
+        while True:
+            pagina, _, siguiente = paginar(CLAVES, 2, despues=despues, desc=desc)
+            vistas.append(pagina)
+            if not siguiente:
+                break
+            despues = pagina[-1]
+        assert [clave for pagina in vistas for clave in pagina] == sorted(CLAVES, reverse=desc)
+        # Volviendo con 'antes' desde cada página se obtiene la anterior
+        for previa, pagina in zip(vistas, vistas[1:]):
+            assert paginar(CLAVES, 2, antes=pagina[0], desc=desc)[0] == previa
+
+
+def test_lista_vacia():
+    assert paginar([], 5) == ([], False, False)
+    assert paginar([], 5, desc=True) == ([], False, False)
+
+
+def test_indice_ordenado_claves_y_rango():
+    indice = IndiceOrdenado(lambda p: (p.precio, p.id))
+    for id, precio in [(1, 5.0), (2, 1.0), (3, 5.0), (4, 3.0)]:
+        indice.agregar(Item(id, precio))
+    assert ids(indice.claves) == [2, 4, 1, 3]
+    assert ids(indice.rango(3.0, 5.0)) == [4, 1, 3]
+    assert ids(indice.rango(None, 3.0)) == [2, 4]
+    assert indice.clave(4) == (3.0, 4)
+    # Reemplazar un objeto mueve su clave
+    indice.agregar(Item(2, 9.0))
+    assert ids(indice.claves) == [4, 1, 3, 2]
+    indice.eliminar(1)
+    indice.eliminar(99)
+    assert len(indice) == 3
+    # Inventario pagina directamente sobre la lista de claves del índice
+    assert ids(paginar(indice.claves, 2, despues=(3.0, 4))[0]) == [3, 2]
+    assert ids(paginar(indice.claves, 2, desc=True)[0]) == [2, 3]
@@ -0,0 +1,50 @@
+from user_availability import FiltroBloom, clave_disponibilidad
+
+
+def test_sin_falsos_negativos():
+    filtro = FiltroBloom(capacidad=500, tasa_error=0.01)
+    valores = [f'usuario{i}@ejemplo.com' for i in range(500)]
+    for valor in valores:
+        filtro.agregar(valor)
+    assert all(valor in filtro for valor in valores)
+
+
+def test_tasa_de_falsos_positivos_cerca_de_la_pedida():
+    filtro = FiltroBloom(capacidad=1000, tasa_error=0.01)
+    for i in range(1000):
+        filtro.agregar(f'dentro{i}')
+    falsos = sum(f'fuera{i}' in filtro for i in range(10000))
+    # Margen amplio sobre el 1 % esperado para que la prueba sea estable
+    assert falsos < 300
+
+
+def test_filtro_vacio_no_contiene_nada():
+    filtro = FiltroBloom()
+    assert 'alguien' not in filtro
+    assert filtro.elementos == 0
+
+
+def test_agregar_dos_veces_no_infla_elementos():
+    filtro = FiltroBloom(capacidad=100)
+    assert filtro.agregar('ana') is True
+    assert filtro.agregar('ana') is False
+    assert filtro.agregar('luis') is True
+    assert filtro.elementos == 2
+
+
+def test_dimensionado():
+    filtro = FiltroBloom(capacidad=1000, tasa_error=0.01)
+    # m = -n ln p / (ln 2)^2 ~ 9586 bits, k = m/n ln 2 ~ 7
+    assert 9500 <= filtro.num_bits <= 9600
+    assert filtro.num_hashes == 7
+    assert len(filtro.bits) == (filtro.num_bits + 7) // 8
+    # Capacidades degeneradas no rompen el cálculo
+    assert FiltroBloom(capacidad=0).num_bits >= 8
+
+
+def test_clave_como_la_collation():
+    filtro = FiltroBloom(capacidad=10)
+    filtro.agregar(clave_disponibilidad('José.Pérez'))
+    assert clave_disponibilidad('jose.perez  ') in filtro
+    assert clave_disponibilidad('JOSÉ.PÉREZ') in filtro
+    assert clave_disponibilidad(None) == ''
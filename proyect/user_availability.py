@@ -0,0 +1,133 @@
+from models import db, Usuario
+from search_index import normalizar
+import hashlib
+import math
+import threading
+
+# Filtro de Bloom: conjunto aproximado sin falsos negativos. Si dice que un
+# valor no está, seguro que no está; si dice que está, puede equivocarse
+# con probabilidad 'tasa_error' mientras no se supere 'capacidad'.
+class FiltroBloom:
+
+    def __init__(self, capacidad=1000, tasa_error=0.01):
+        self.capacidad = max(1, capacidad)
+        self.tasa_error = tasa_error
+        self.num_bits = max(8, math.ceil(-self.capacidad * math.log(tasa_error) / math.log(2) ** 2))
+        self.num_hashes = max(1, round(self.num_bits / self.capacidad * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.elementos = 0
+
+    # Posiciones de los bits con doble hashing (h1 + i*h2) sobre un blake2b
+    def _posiciones(self, valor):
+        digest = hashlib.blake2b(valor.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    # Solo cuenta el valor si encendió algún bit: volver a agregar uno que ya
+    # estaba (p. ej. el mismo usuario devuelto por el registro de cambios tras
+    # editarlo) no infla 'elementos'. Un valor nuevo que cae en bits ya
+    # encendidos tampoco se cuenta, pero eso solo pasa con 'tasa_error'.
+    def agregar(self, valor):
+        nuevo = False
+        for pos in self._posiciones(valor):
+            byte, bit = pos >> 3, 1 << (pos & 7)
+            if not self.bits[byte] & bit:
+                self.bits[byte] |= bit
+                nuevo = True
+        if nuevo:
+            self.elementos += 1
+        return nuevo
+
+    def __contains__(self, valor):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._posiciones(valor))
+
+# Aproxima la collation de la tabla (utf8mb4_unicode_ci), que ignora
+# mayúsculas, acentos y espacios finales. No la reproduce entera: la
+# collation también iguala expansiones como 'æ' y 'ae' o 'ß' y 'ss', que aquí
+# dan claves distintas. Por eso un negativo del filtro es solo orientativo
+# (ver confirmar en DisponibilidadUsuarios); normalizar de más solo añade
+# falsos positivos, que se confirman en la base.
+def clave_disponibilidad(valor):
+    return normalizar(valor or '').strip()
+
+# Comprobación rápida de nombres de usuario y emails ocupados. Los negativos
+# del filtro se responden sin tocar la base (la consulta mientras se escribe
+# en el formulario); los positivos, y todo lo que pida 'confirmar' (la
+# validación del registro), se consultan en la base. Las bajas no se pueden
+# quitar de un filtro de Bloom: quedan como falsos positivos hasta la
+# siguiente reconstrucción, que se hace al superar la capacidad o con un
+# 'reset' del registro de cambios.
+class DisponibilidadUsuarios:
+
+    def __init__(self, tasa_error=0.01):
+        self.tasa_error = tasa_error
+        self.usernames = FiltroBloom(tasa_error=tasa_error)
+        self.emails = FiltroBloom(tasa_error=tasa_error)
+        self.cargado = False
+        self._lock = threading.Lock()
+        self.metricas = {'sin_consulta': 0, 'confirmados': 0, 'falsos_positivos': 0}
+
+    # Construye los filtros con todos los usuarios existentes
+    def cargar(self):
+        filas = db.session.query(Usuario.username, Usuario.email).all()
+        capacidad = max(1000, 2 * len(filas))
+        usernames = FiltroBloom(capacidad, self.tasa_error)
+        emails = FiltroBloom(capacidad, self.tasa_error)
+        for username, email in filas:
+            usernames.agregar(clave_disponibilidad(username))
+            emails.agregar(clave_disponibilidad(email))
+        with self._lock:
+            self.usernames, self.emails = usernames, emails
+            self.cargado = True
+
+    def agregar(self, username, email):
+        with self._lock:
+            self.usernames.agregar(clave_disponibilidad(username))
+            self.emails.agregar(clave_disponibilidad(email))
+            lleno = self.usernames.elementos > self.usernames.capacidad
+        if lleno:
+            self.cargar()
+
+    # Suscriptor del SincronizadorCambios para la entidad 'usuario'
+    def aplicar_cambios(self, cambios):
+        if not self.cargado:
+            return
+        if any(c.accion == 'reset' for c in cambios):
+            self.cargar()
+            return
+        ids = {c.entidad_id for c in cambios if c.accion == 'guardar'}
+        if ids:
+            filas = (db.session.query(Usuario.username, Usuario.email)
+                     .filter(Usuario.id.in_(ids)).all())
+            for username, email in filas:
+                self.agregar(username, email)
+
+    def _disponible(self, filtro, valor, buscar, confirmar):
+        # Sin filtro cargado (p. ej. fuera de la app web) siempre se consulta
+        if not confirmar and self.cargado and clave_disponibilidad(valor) not in filtro:
+            with self._lock:
+                self.metricas['sin_consulta'] += 1
+            return True
+        existe = buscar(valor) is not None
+        with self._lock:
+            self.metricas['confirmados'] += 1
+            if not existe and not confirmar:
+                self.metricas['falsos_positivos'] += 1
+        return not existe
+
+    def username_disponible(self, username, confirmar=False):
+        return self._disponible(self.usernames, username, Usuario.get_by_username, confirmar)
+
+    def email_disponible(self, email, confirmar=False):
+        return self._disponible(self.emails, email, Usuario.get_by_email, confirmar)
+
+    def estado(self):
+        with self._lock:
+            datos = dict(self.metricas)
+            datos['usuarios'] = self.usernames.elementos
+            datos['capacidad'] = self.usernames.capacidad
+        return datos
+
+# Instancia global, la carga app.py al arrancar
+disponibilidad = DisponibilidadUsuarios()
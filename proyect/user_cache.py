@@ -0,0 +1,79 @@
+from models import db, Usuario
+from collections import OrderedDict
+import threading
+import time
+
+# Carga un usuario y lo separa de la sesión para poder guardarlo entre
+# peticiones (sus columnas ya quedan cargadas y no caducan al hacer commit)
+def cargar_usuario(user_id):
+    usuario = db.session.get(Usuario, user_id)
+    if usuario is not None:
+        db.session.expunge(usuario)
+    return usuario
+
+# Caché por worker de los usuarios autenticados que usa el user_loader de
+# Flask-Login. Cada entrada vive 'ttl' segundos y, al superar 'max_entradas',
+# se expulsa la usada hace más tiempo (LRU). Las altas, ediciones y bajas de
+# cualquier proceso llegan por el registro de cambios (entidad 'usuario')
+# e invalidan la entrada; el TTL acota el retraso si la sincronización se
+# hace con intervalo.
+class CacheUsuarios:
+
+    def __init__(self, cargar=cargar_usuario, ttl=300, max_entradas=1000):
+        self.cargar = cargar
+        self.ttl = ttl
+        self.max_entradas = max_entradas
+        self._entradas = OrderedDict()  # id -> (usuario, expira)
+        # Sube con cada invalidación: una carga que empezó antes no se guarda
+        self._generacion = 0
+        self._lock = threading.Lock()
+        self.metricas = {'aciertos': 0, 'fallos': 0, 'invalidaciones': 0}
+
+    # Devuelve el usuario desde la caché o, si no está o caducó, desde la base
+    def obtener(self, user_id):
+        ahora = time.monotonic()
+        with self._lock:
+            entrada = self._entradas.get(user_id)
+            if entrada is not None and entrada[1] > ahora:
+                self._entradas.move_to_end(user_id)
+                self.metricas['aciertos'] += 1
+                return entrada[0]
+            self.metricas['fallos'] += 1
+            generacion = self._generacion
+        usuario = self.cargar(user_id)
+        # Los usuarios inexistentes no se guardan: un alta posterior debe verse
+        if usuario is not None:
+            with self._lock:
+                if generacion != self._generacion:
+                    return usuario
+                self._entradas[user_id] = (usuario, ahora + self.ttl)
+                self._entradas.move_to_end(user_id)
+                while len(self._entradas) > self.max_entradas:
+                    self._entradas.popitem(last=False)
+        return usuario
+
+    def invalidar(self, user_id):
+        with self._lock:
+            self._generacion += 1
+            if self._entradas.pop(user_id, None) is not None:
+                self.metricas['invalidaciones'] += 1
+
+    def limpiar(self):
+        with self._lock:
+            self._generacion += 1
+            self.metricas['invalidaciones'] += len(self._entradas)
+            self._entradas.clear()
+
+    # Suscriptor del SincronizadorCambios para la entidad 'usuario'
+    def aplicar_cambios(self, cambios):
+        if any(c.accion == 'reset' for c in cambios):
+            self.limpiar()
+            return
+        for c in cambios:
+            self.invalidar(c.entidad_id)
+
+    def estado(self):
+        with self._lock:
+            datos = dict(self.metricas)
+            datos['entradas'] = len(self._entradas)
+        return datos
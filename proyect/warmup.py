@@ -0,0 +1,82 @@
+import os
+import threading
+import time
+
+# Calentamiento en segundo plano de un worker: ejecuta en orden los pasos
+# (nombre, funcion) dentro de un contexto de la app. Si uno falla (p. ej. la
+# base no responde) se reintenta desde ese paso con espera creciente, sin
+# dar nunca por listo un worker a medio cargar. /readyz consulta estado().
+class Calentamiento:
+
+    def __init__(self, app, pasos, espera_max=30):
+        self.app = app
+        self.pasos = pasos
+        self.espera_max = espera_max
+        self.estado_actual = 'pendiente'   # pendiente, en_curso, reintentando, listo
+        self.paso = 0
+        self.intentos = 0
+        self.error = None
+        self.resultados = {}               # nombre del paso -> valor devuelto
+        self.duraciones = {}               # nombre del paso -> segundos
+        self._inicio = None
+        self._fin = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def listo(self):
+        return self.estado_actual == 'listo'
+
+    # Arranca el hilo si este proceso todavía no lo tiene. Un worker creado
+    # con fork después de terminar el calentamiento (gunicorn --preload)
+    # hereda los datos ya cargados y no repite el trabajo.
+    def asegurar_iniciado(self):
+        if self.listo or self._pid == os.getpid():
+            return
+        with self._lock:
+            if self.listo or self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self.estado_actual = 'en_curso'
+            self._inicio = time.monotonic()
+            threading.Thread(target=self._ejecutar, name='calentamiento', daemon=True).start()
+
+    def _ejecutar(self):
+        espera = 1
+        while self.paso < len(self.pasos):
+            nombre, funcion = self.pasos[self.paso]
+            inicio = time.monotonic()
+            try:
+                with self.app.app_context():
+                    self.resultados[nombre] = funcion()
+            except Exception as e:
+                self.intentos += 1
+                self.error = f'{nombre}: {e}'
+                self.estado_actual = 'reintentando'
+                print(f"Error en el calentamiento ({self.error}); reintento en {espera}s")
+                time.sleep(espera)
+                espera = min(espera * 2, self.espera_max)
+                continue
+            self.duraciones[nombre] = round(time.monotonic() - inicio, 3)
+            self.paso += 1
+            espera = 1
+        self.error = None
+        self._fin = time.monotonic()
+        self.estado_actual = 'listo'
+
+    def estado(self):
+        total = None
+        if self._inicio is not None:
+            total = round((self._fin or time.monotonic()) - self._inicio, 3)
+        return {
+            'estado': self.estado_actual,
+            'pasos_completados': self.paso,
+            'pasos_totales': len(self.pasos),
+            'paso_actual': self.pasos[self.paso][0] if self.paso < len(self.pasos) else None,
+            'intentos_fallidos': self.intentos,
+            'error': self.error,
+            'resultados': self.resultados,
+            'duraciones': self.duraciones,
+            'segundos': total,
+            'pid': os.getpid(),
+        }